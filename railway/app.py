@@ -1,12 +1,23 @@
 import json
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context, g
 from flask_cors import CORS
 import os
+import hashlib
+import itertools
+import threading
+import time
+import zlib
 
-from git_utils import get_file_from_github, save_file_to_github
+import logs
+import metrics
+import train_queue
+from git_utils import get_file_from_github
 
 app = Flask(__name__)
 CORS(app, origins=["https://www.ton.com.br"], supports_credentials=True)
+metrics.start_flusher()
+# Retoma jobs de treino pendentes (de antes de um reinício ou de outro worker)
+train_queue.start_worker()
 
 EXAMPLES_FILE = "ux_examples.json"
 LABELS_FILE = "labels.json"
@@ -14,96 +25,230 @@ VOCAB_FILE = "allWords.json"
 MODEL_FILE = "model.bin"
 USERS_FILE = "users.json"
 
+# Paginação do /get_examples
+EXAMPLES_PAGE_DEFAULT = 500
+EXAMPLES_PAGE_MAX = 5000
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    # Store append-only de exemplos; na primeira vez importa o ux_examples.json atual.
+    # Lock: duas primeiras requisições simultâneas não criam dois stores/exporters
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is not None:
+            return _store
+        from example_store import ExampleStore
+        store = ExampleStore()
+        if store.last_seq == 0:
+            content, sha = get_file_from_github(EXAMPLES_FILE)
+            if not content and os.path.exists(EXAMPLES_FILE):
+                with open(EXAMPLES_FILE, "rb") as f:
+                    content = f.read()
+            if content:
+                try:
+                    from example_store import validate_example
+                    examples = json.loads(content.decode("utf-8"))
+                    valid = [ex for ex in examples if validate_example(ex) is None]
+                    logs.info("example_store_import", novos=store.append(valid), invalidos=len(examples) - len(valid))
+                except Exception as ex:
+                    logs.error("example_store_import_failed", erro=str(ex))
+        store.start_exporter()
+        _store = store
+    return _store
+
 @app.route("/", methods=["GET"])
 def health():
-    print("[Auto-UX] API online (healthcheck)")
     return "Auto-UX API online", 200
 
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.get("request_started")
+    if started is not None and request.url_rule is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, request.url_rule.rule, request.method,
+                                        str(response.status_code))
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    from model_predict import prediction_cache_stats
+    cache = prediction_cache_stats()
+    for key in ("entries", "bytes", "hits", "shared_hits", "misses", "evictions"):
+        metrics.PREDICTION_CACHE.set(cache[key], key)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def _wants_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+def _gzip_stream(chunks):
+    # gzip incremental: comprime conforme os pedaços são gerados
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = comp.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield comp.flush()
+
+def _etag_response(body, etag, mimetype):
+    if etag in request.if_none_match:
+        resp = make_response("", 304)
+    else:
+        data = b"".join(_gzip_stream([body])) if _wants_gzip() else body.encode("utf-8")
+        resp = make_response(data, 200)
+        resp.mimetype = mimetype
+        if _wants_gzip():
+            resp.headers["Content-Encoding"] = "gzip"
+    resp.set_etag(etag)
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+def _stream_response(chunks, etag, mimetype):
+    if etag in request.if_none_match:
+        resp = make_response("", 304)
+    else:
+        chunks = stream_with_context(chunks)
+        if _wants_gzip():
+            resp = Response(_gzip_stream(chunks), mimetype=mimetype)
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = Response((c.encode("utf-8") for c in chunks), mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+# GET /get_examples
+#   sem parâmetros: lista completa (mesmo formato de antes), gerada em streaming
+#   ?limit=N&after=<seq>&sessao=X: uma página; "next" é o cursor da próxima (None no fim)
+#   ?format=ndjson: um exemplo por linha, em streaming (aceita after/limit/sessao)
+# Respostas com ETag (If-None-Match -> 304) e gzip quando o cliente aceita.
 @app.route("/get_examples", methods=["GET"])
 def get_examples():
-    print("[Auto-UX] /get_examples chamado")
-    content, sha = get_file_from_github(EXAMPLES_FILE)
-    if not content:
-        return jsonify({"ok": True, "examples": []})
+    store = get_store()
     try:
-        data = json.loads(content.decode("utf-8"))
-    except Exception:
-        data = []
-    return jsonify({"ok": True, "examples": data})
+        after = int(request.args.get("after", 0))
+        limit = request.args.get("limit")
+        limit = min(int(limit), EXAMPLES_PAGE_MAX) if limit is not None else None
+    except ValueError:
+        return jsonify({"ok": False, "msg": "after/limit devem ser inteiros"}), 400
+    if after < 0 or (limit is not None and limit <= 0):
+        return jsonify({"ok": False, "msg": "after deve ser >= 0 e limit > 0"}), 400
+    sessao = request.args.get("sessao")
+    fmt = request.args.get("format", "json")
+
+    records = store.iter_records(after=after)
+    if sessao:
+        records = (r for r in records if r["ex"].get("sessao") == sessao)
+
+    if fmt == "ndjson" or (limit is None and "after" not in request.args):
+        # Streaming: o ETag depende só dos parâmetros e do último seq do store
+        etag = hashlib.sha1(f"{store.last_seq}|{after}|{limit}|{sessao}|{fmt}".encode("utf-8")).hexdigest()
+        records = itertools.islice(records, limit) if limit else records
+        if fmt == "ndjson":
+            chunks = (json.dumps(dict(r["ex"], _seq=r["seq"]), ensure_ascii=False) + "\n" for r in records)
+            return _stream_response(chunks, etag, "application/x-ndjson")
+        def full_list():
+            yield '{"ok": true, "examples": ['
+            for i, r in enumerate(records):
+                yield ("," if i else "") + json.dumps(r["ex"], ensure_ascii=False)
+            yield "]}"
+        return _stream_response(full_list(), etag, "application/json")
+
+    page = list(itertools.islice(records, limit or EXAMPLES_PAGE_DEFAULT))
+    next_cursor = page[-1]["seq"] if len(page) == (limit or EXAMPLES_PAGE_DEFAULT) else None
+    body = json.dumps({"ok": True, "examples": [r["ex"] for r in page], "next": next_cursor}, ensure_ascii=False)
+    # Página completa nunca muda (store é append-only): ETag pelo conteúdo
+    return _etag_response(body, hashlib.sha1(body.encode("utf-8")).hexdigest(), "application/json")
 
 @app.route("/get_labels", methods=["GET"])
 def get_labels():
-    print("[Auto-UX] /get_labels chamado")
     content, sha = get_file_from_github(LABELS_FILE)
     try:
         labels = json.loads(content.decode("utf-8")) if content else []
-        print("[Auto-UX] Labels retornados (locais):", labels)
+        logs.debug("get_labels", n=len(labels))
         return jsonify({"ok": True if labels else False, "labels": labels})
     except Exception:
-        print("[Auto-UX] Erro ao carregar labels.json")
+        logs.error("get_labels_failed")
         return jsonify({"ok": False, "labels": []})
 
 @app.route("/predict", methods=["POST"])
 def predict():
-    print("[Auto-UX] /predict chamado")
     try:
-        from model_predict import predict_session
+        from model_predict import predict_sessions
         features = request.get_json()
-        print("[Auto-UX] Features recebidas:", features)
-        label, score = predict_session(features)
-        print("[Auto-UX] Predição:", label, score)
-        return jsonify({"ok": True, "sessao": label, "score": score})
+        if logs.sample_payload():
+            logs.debug("predict_payload", features=features)
+        result = predict_sessions([features])[0]
+        logs.debug("predict", sessao=result["sessao"], score=result["score"], stage=result["stage"],
+                   timings=result["timings"])
+        return jsonify({"ok": True, **result})
+    except Exception as e:
+        logs.error("predict_failed", erro=str(e), exc_info=True)
+        return jsonify({"ok": False, "msg": str(e)}), 500
+
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    try:
+        from model_predict import predict_sessions
+        features_list = request.get_json()
+        if not isinstance(features_list, list):
+            return jsonify({"ok": False, "msg": "Payload deve ser lista de features"}), 400
+        if logs.sample_payload():
+            logs.debug("predict_batch_payload", features=features_list)
+        results = predict_sessions(features_list)
+        logs.debug("predict_batch", n=len(features_list))
+        return jsonify({"ok": True, "results": results})
     except Exception as e:
-        print("[Auto-UX] ERRO no predict:", e)
+        logs.error("predict_batch_failed", erro=str(e), exc_info=True)
         return jsonify({"ok": False, "msg": str(e)}), 500
 
+@app.route("/prediction_cache", methods=["GET"])
+def prediction_cache():
+    from model_predict import prediction_cache_stats
+    return jsonify({"ok": True, **prediction_cache_stats()})
+
 @app.route("/salvar_examples", methods=["POST"])
 def salvar_examples():
-    print("[Auto-UX] /salvar_examples CHAMADO")
     data = request.get_json()
-    print("[Auto-UX] Dados recebidos (len):", len(data) if data else "Nada")
+    if logs.sample_payload():
+        logs.debug("salvar_examples_payload", examples=data)
     if not data or not isinstance(data, list):
-        print("[Auto-UX] Payload inválido:", data)
+        logs.warning("salvar_examples_invalid", tipo=type(data).__name__)
         return jsonify({"ok": False, "msg": "Payload deve ser lista de exemplos"}), 400
-
-    old_content, old_sha = get_file_from_github(EXAMPLES_FILE)
-    exemplos_atuais = []
-    if old_content:
-        try:
-            exemplos_atuais = json.loads(old_content.decode("utf-8"))
-        except Exception as ex:
-            print("[Auto-UX] Falha ao ler exemplos antigos:", ex)
-            exemplos_atuais = []
-
-    exemplos_finais = exemplos_atuais + data
-    print(f"[Auto-UX] Antes de salvar: antigos={len(exemplos_atuais)}, novos={len(data)}, final={len(exemplos_finais)}")
-
-    status, resp = save_file_to_github(
-        EXAMPLES_FILE,
-        json.dumps(exemplos_finais, ensure_ascii=False, indent=2),
-        "Incrementa exemplos UX",
-        sha=old_sha
-    )
-    print("[Auto-UX] save_file_to_github status:", status, "resp:", str(resp)[:200])
-    if status not in (200, 201):
-        print("[Auto-UX] ERRO ao salvar no GitHub")
-        return jsonify({"ok": False, "msg": "Erro ao salvar exemplos no GitHub", "resp": resp}), 500
+    # O store é append-only: um exemplo ruim ficaria lá para sempre (e quebraria o treino)
+    from example_store import validate_example
+    errors = [f"{i}: {err}" for i, err in enumerate(validate_example(ex) for ex in data) if err]
+    if errors:
+        logs.warning("salvar_examples_invalid", invalidos=len(errors))
+        return jsonify({"ok": False, "msg": "Exemplos inválidos", "errors": errors[:20]}), 400
 
     try:
-        import time
-        print("[Auto-UX] Iniciando treinamento automático após salvar exemplos...")
-        t0 = time.time()
-        from train_ux import train_and_save_model
-        with open(EXAMPLES_FILE, "w", encoding="utf-8") as f:
-            json.dump(exemplos_finais, f, ensure_ascii=False, indent=2)
-        train_and_save_model(EXAMPLES_FILE)
-        t1 = time.time()
-        print(f"[Auto-UX] Treinamento concluído em {t1-t0:.1f}s.")
-        return jsonify({"ok": True, "msg": f"Incrementados {len(data)} exemplos. Modelo treinado!"})
+        store = get_store()
+        novos = store.append(data)
+        logs.info("salvar_examples", recebidos=len(data), novos=novos, total=store.last_seq)
+        if not novos:
+            return jsonify({"ok": True, "job_id": None, "msg": "Nenhum exemplo novo (todos duplicados)."})
+        # O snapshot sobe para o GitHub em lote pelo exporter; o treino lê direto do store
+        job_id = train_queue.submit_training(store.root)
+        return jsonify({"ok": True, "job_id": job_id,
+                        "msg": f"Incrementados {novos} exemplos. Treinamento agendado."}), 202
     except Exception as e:
-        print("[Auto-UX] ERRO no treino automático:", e)
+        logs.error("salvar_examples_failed", erro=str(e), exc_info=True)
         return jsonify({"ok": False, "msg": str(e)}), 500
 
+@app.route("/train_status/<job_id>", methods=["GET"])
+def train_status(job_id):
+    status = train_queue.get_status(job_id)
+    if status is None:
+        return jsonify({"ok": False, "msg": "Job não encontrado"}), 404
+    return jsonify({"ok": True, **status})
+
 @app.after_request
 def add_cors_headers(response):
     response.headers["Access-Control-Allow-Origin"] = "https://www.ton.com.br"
@@ -123,7 +268,7 @@ def options_handler(path):
 def handle_error(e):
     import traceback
     tb = traceback.format_exc()
-    print("[Auto-UX] ERRO GLOBAL:", e, tb)
+    logs.error("unhandled_error", erro=str(e), exc_info=True)
     resp = make_response(str(e) + "\n" + tb, 500)
     resp.headers["Access-Control-Allow-Origin"] = "https://www.ton.com.br"
     resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
@@ -131,5 +276,5 @@ def handle_error(e):
     return resp
 
 if __name__ == "__main__":
-    print("[Auto-UX] Iniciando API Railway")
+    logs.info("startup")
     app.run(host="0.0.0.0", port=8080)
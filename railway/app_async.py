@@ -0,0 +1,227 @@
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes
+
+from aiohttp import web
+
+import logs
+import metrics
+from batcher import MicroBatcher, Overloaded
+
+# Modo de servir asyncio (aiohttp), alternativa ao "gunicorn app:app" com workers síncronos:
+#   POST /predict e /predict_batch passam pelo MicroBatcher (batcher.py): requisições
+#   simultâneas viram um lote só de predict_sessions, rodando num executor dedicado.
+#   Fila cheia -> 503 com Retry-After, em vez de a requisição esperar até o timeout.
+#   As demais rotas continuam no app Flask (app.py), chamado como WSGI num pool de threads;
+#   cada requisição roda inteira numa thread (streaming e stream_with_context funcionam).
+# Uso: python app_async.py
+#      gunicorn app_async:gunicorn_app --worker-class aiohttp.GunicornWebWorker
+# Nos dois casos o handler de quem desconecta é cancelado (handler_cancellation), e o
+# pedido sai do lote antes de rodar; make_app() sozinho não liga isso.
+
+PORT = int(os.getenv("PORT", "8080"))
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "8"))
+# Limite do corpo das requisições (o Flask não tem; o padrão do aiohttp é 1 MB)
+MAX_BODY_MB = int(os.getenv("MAX_BODY_MB", "32"))
+ALLOWED_ORIGIN = "https://www.ton.com.br"
+
+def _json(data, status=200, headers=None):
+    return web.json_response(data, status=status, headers=headers)
+
+def _overloaded(batcher):
+    logs.warning("predict_overloaded", fila=batcher.queued())
+    return _json({"ok": False, "msg": "Servidor ocupado, tente novamente em instantes"}, 503,
+                 headers={"Retry-After": "1"})
+
+async def predict(request):
+    try:
+        features = await request.json()
+    except ValueError:
+        return _json({"ok": False, "msg": "JSON inválido"}, 400)
+    if not isinstance(features, dict):
+        return _json({"ok": False, "msg": "Payload deve ser um objeto de features"}, 400)
+    if logs.sample_payload():
+        logs.debug("predict_payload", features=features)
+    batcher = request.app["batcher"]
+    try:
+        result = (await batcher.submit([features]))[0]
+    except Overloaded:
+        return _overloaded(batcher)
+    except Exception as e:
+        logs.error("predict_failed", erro=str(e), exc_info=True)
+        return _json({"ok": False, "msg": str(e)}, 500)
+    logs.debug("predict", sessao=result["sessao"], score=result["score"], stage=result["stage"],
+               timings=result["timings"])
+    return _json({"ok": True, **result})
+
+async def predict_batch(request):
+    try:
+        features_list = await request.json()
+    except ValueError:
+        return _json({"ok": False, "msg": "JSON inválido"}, 400)
+    if not isinstance(features_list, list) or not all(isinstance(f, dict) for f in features_list):
+        return _json({"ok": False, "msg": "Payload deve ser lista de features"}, 400)
+    if logs.sample_payload():
+        logs.debug("predict_batch_payload", features=features_list)
+    if not features_list:
+        return _json({"ok": True, "results": []})
+    batcher = request.app["batcher"]
+    try:
+        results = await batcher.submit(features_list)
+    except Overloaded:
+        return _overloaded(batcher)
+    except Exception as e:
+        logs.error("predict_batch_failed", erro=str(e), exc_info=True)
+        return _json({"ok": False, "msg": str(e)}, 500)
+    logs.debug("predict_batch", n=len(features_list))
+    return _json({"ok": True, "results": results})
+
+def _wsgi_environ(request, body):
+    path = request.raw_path.split("?", 1)[0]
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        # PEP 3333: bytes do caminho decodificados como latin-1
+        "PATH_INFO": unquote_to_bytes(path).decode("latin-1"),
+        # Query crua: a decodificada do aiohttp quebraria %26/%3D e decodificaria acentos duas vezes
+        "QUERY_STRING": request.rel_url.raw_query_string,
+        "SERVER_NAME": request.url.host or "localhost",
+        "SERVER_PORT": str(request.url.port or PORT),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "CONTENT_TYPE": request.headers.get("Content-Type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in request.headers.items():
+        key = "HTTP_" + name.upper().replace("-", "_")
+        if key in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+            continue
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+def _run_wsgi(wsgi_app, environ, loop, queue):
+    # Na thread do pool: roda o app e entrega (status, headers) e depois os pedaços do corpo.
+    # put bloqueante numa fila limitada: cliente lento segura o gerador (sem acumular tudo em memória)
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put(("start", status, headers))
+        return lambda data: put(("data", data))
+
+    try:
+        result = wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    put(("data", chunk))
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    except Exception as e:
+        put(("error", e))
+    finally:
+        put(("end",))
+
+async def wsgi_bridge(request):
+    app = request.app
+    body = await request.read()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=16)
+    job = loop.run_in_executor(app["wsgi_pool"], _run_wsgi, app["flask"], _wsgi_environ(request, body), loop, queue)
+    response = None
+    try:
+        while True:
+            item = await queue.get()
+            if item[0] == "start" and response is None:
+                code, reason = item[1].split(" ", 1)
+                response = web.StreamResponse(status=int(code), reason=reason)
+                for name, value in item[2]:
+                    response.headers.add(name, value)
+            elif item[0] == "data":
+                if not response.prepared:
+                    await response.prepare(request)
+                await response.write(item[1])
+            elif item[0] == "error":
+                if response is None or not response.prepared:
+                    raise item[1]
+                logs.error("wsgi_stream_failed", erro=str(item[1]))
+            elif item[0] == "end":
+                break
+        if not response.prepared:
+            await response.prepare(request)
+        await response.write_eof()
+        return response
+    finally:
+        # Cliente desconectou no meio: esvazia a fila para a thread não ficar presa no put
+        while not job.done():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.001)
+
+@web.middleware
+async def _native_routes(request, handler):
+    # Latência e CORS das rotas atendidas aqui; as do Flask já têm os dele
+    resource = request.match_info.route.resource
+    if resource is None or request.match_info.handler is wsgi_bridge:
+        return await handler(request)
+    started = time.perf_counter()
+    response = await handler(request)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, resource.canonical, request.method,
+                                    str(response.status))
+    response.headers["Access-Control-Allow-Origin"] = ALLOWED_ORIGIN
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    if request.headers.get("Origin") == ALLOWED_ORIGIN:
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+    return response
+
+async def _startup(app):
+    app["batcher"].start()
+    # Carrega os modelos antes da primeira requisição (sem modelo ainda: carrega na primeira)
+    try:
+        from model_predict import _load_all
+        await asyncio.get_running_loop().run_in_executor(app["batcher"].executor, _load_all)
+    except Exception as e:
+        logs.warning("model_preload_failed", erro=str(e))
+
+async def _cleanup(app):
+    await app["batcher"].stop()
+    app["wsgi_pool"].shutdown(wait=False, cancel_futures=True)
+
+def make_app():
+    from app import app as flask_app
+    from model_predict import predict_sessions
+    app = web.Application(middlewares=[_native_routes], client_max_size=MAX_BODY_MB * 1024 * 1024)
+    app["flask"] = flask_app
+    app["batcher"] = MicroBatcher(predict_sessions)
+    app["wsgi_pool"] = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+    app.router.add_post("/predict", predict)
+    app.router.add_post("/predict_batch", predict_batch)
+    # Preflight (OPTIONS) e o resto da API seguem para o Flask
+    app.router.add_route("*", "/{tail:.*}", wsgi_bridge)
+    app.on_startup.append(_startup)
+    app.on_cleanup.append(_cleanup)
+    return app
+
+async def gunicorn_app():
+    # Fábrica para o GunicornWebWorker: devolvendo o runner, o worker usa as opções dele
+    # (o worker sozinho não repassa handler_cancellation)
+    logs.info("startup", mode="async-gunicorn")
+    return web.AppRunner(make_app(), handler_cancellation=True)
+
+if __name__ == "__main__":
+    logs.info("startup", mode="async", port=PORT)
+    web.run_app(make_app(), host="0.0.0.0", port=PORT, print=None, handler_cancellation=True)
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+import metrics
+
+# Micro-batching dinâmico para o modo asyncio (app_async.py): requisições que chegam dentro
+# de uma janela curta (ou até juntar BATCH_MAX_ITEMS elementos) viram uma única chamada de
+# predict_sessions, com um featurize/RF, um encode SBERT e um produto por etapa para todas.
+# A inferência roda num executor dedicado (PREDICT_THREADS threads), fora do event loop;
+# enquanto um lote roda, os próximos vão se acumulando e o lote seguinte sai maior.
+# Com mais de BATCH_MAX_QUEUE elementos esperando, ou com o mais antigo da fila esperando há
+# mais de BATCH_MAX_WAIT_MS, submit levanta Overloaded (vira 503) em vez de deixar a
+# requisição esperar até o timeout do cliente.
+
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "3"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "64"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "512"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2000"))
+PREDICT_THREADS = int(os.getenv("PREDICT_THREADS", "1"))
+
+class Overloaded(Exception):
+    pass
+
+class MicroBatcher:
+    def __init__(self, fn, window_ms=BATCH_WINDOW_MS, max_items=BATCH_MAX_ITEMS, max_queue=BATCH_MAX_QUEUE,
+                 max_wait_ms=BATCH_MAX_WAIT_MS, threads=PREDICT_THREADS):
+        # fn(lista de itens) -> lista de resultados na mesma ordem (ex.: predict_sessions)
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_items = max_items
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000.0
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="predict")
+        self._slots = None
+        self._queue = deque()  # (itens, future, chegada)
+        self._queued_items = 0
+        self._wakeup = None
+        self._collector = None
+
+    def start(self):
+        # Chamado de dentro do event loop (on_startup do app)
+        self._slots = asyncio.Semaphore(self.threads)
+        self._wakeup = asyncio.Event()
+        self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def queued(self):
+        return self._queued_items
+
+    async def submit(self, items):
+        # Fila vazia aceita qualquer tamanho (um /predict_batch grande não é recusado à toa)
+        if self._queued_items and self._queued_items + len(items) > self.max_queue:
+            metrics.PREDICT_REJECTED.inc()
+            raise Overloaded(f"fila de predição cheia ({self._queued_items} elementos)")
+        # O limite em elementos depende da máquina/modelo; o de espera não
+        if self._queue and time.perf_counter() - self._queue[0][2] > self.max_wait:
+            metrics.PREDICT_REJECTED.inc()
+            raise Overloaded(f"fila de predição atrasada ({self._queued_items} elementos)")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((items, future, time.perf_counter()))
+        self._queued_items += len(items)
+        metrics.PREDICT_QUEUE_DEPTH.set(self._queued_items)
+        self._wakeup.set()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Espera a janela (contada da chegada do mais antigo) ou o lote encher
+            deadline = self._queue[0][2] + self.window
+            while self._queued_items < self.max_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            # Uma requisição nunca é dividida; a primeira entra mesmo se passar de max_items sozinha
+            batch, n = [], 0
+            while self._queue and (not batch or n + len(self._queue[0][0]) <= self.max_items):
+                items, future, _ = self._queue.popleft()
+                batch.append((items, future))
+                n += len(items)
+            self._queued_items -= n
+            metrics.PREDICT_QUEUE_DEPTH.set(self._queued_items)
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [(items, future) for items, future in batch if not future.cancelled()]
+            if not batch:
+                return
+            flat = [item for items, _ in batch for item in items]
+            metrics.PREDICT_BATCH_SIZE.observe(len(flat))
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, flat)
+            except Exception as e:
+                if len(batch) == 1:
+                    _set(batch[0][1], exc=e)
+                    return
+                # Um payload ruim não derruba os vizinhos de lote: refaz cada requisição sozinha
+                logs.warning("batch_failed_retrying", requests=len(batch), erro=str(e))
+                for items, future in batch:
+                    try:
+                        _set(future, await loop.run_in_executor(self.executor, self.fn, items))
+                    except Exception as e_single:
+                        _set(future, exc=e_single)
+                return
+            start = 0
+            for items, future in batch:
+                _set(future, results[start:start + len(items)])
+                start += len(items)
+        finally:
+            self._slots.release()
+
+def _set(future, result=None, exc=None):
+    # O cliente pode ter desistido (future cancelado) enquanto o lote rodava
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
@@ -0,0 +1,55 @@
+import json
+import sys
+import time
+import warnings
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from featurizer import Featurizer, build_vocab
+from compiled_forest import CompiledForest
+from bench_suite import synthetic_examples
+
+# Benchmark da etapa RF: predict_proba do sklearn x CompiledForest (mesmas 120 árvores),
+# uma linha por chamada e em lotes, em corpora sintéticos de 1x/10x/100x o ux_examples.json.
+# Confere antes que as probabilidades são idênticas (array_equal) às do sklearn.
+# Uso: python bench_forest.py [ux_examples.json] [escalas separadas por vírgula]
+
+def _us_per_row(fn, batches, budget_s=2.0):
+    n_rows = 0
+    t0 = time.perf_counter()
+    while n_rows == 0 or time.perf_counter() - t0 < budget_s:
+        for batch in batches:
+            fn(batch)
+            n_rows += len(batch)
+    return (time.perf_counter() - t0) * 1e6 / n_rows
+
+def bench(examples, queries, batch_sizes=(1, 64)):
+    fz = Featurizer(build_vocab(examples))
+    clf = RandomForestClassifier(n_estimators=120, random_state=42)
+    clf.fit(fz.transform(examples), [ex["sessao"] for ex in examples])
+    forest = CompiledForest.from_sklearn(clf)
+    rows = [fz.token_indices(q) for q in queries]
+    X = fz.transform(queries)
+    if not np.array_equal(clf.predict_proba(X), forest.predict_proba_indices(rows)):
+        raise AssertionError("CompiledForest diverge do sklearn")
+    result = {"nodes": len(forest.feature), "max_depth": forest.max_depth}
+    for bs in batch_sizes:
+        idx = [list(range(i, min(i + bs, len(queries)))) for i in range(0, len(queries), bs)]
+        result[bs] = (_us_per_row(lambda b: clf.predict_proba(X[b]), idx),
+                      _us_per_row(lambda b: forest.predict_proba_indices([rows[i] for i in b]), idx))
+    return result
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+    path = sys.argv[1] if len(sys.argv) > 1 else "ux_examples.json"
+    scales = [int(x) for x in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 10, 100]
+    with open(path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    queries = synthetic_examples(base, 2 * len(base), seed=7)[len(base):]
+    print(f"{'exemplos':>9} {'nós':>8} {'prof.':>5} {'lote':>5} {'sklearn (µs/linha)':>19} {'compilado':>10} {'speedup':>8}")
+    for scale in scales:
+        examples = synthetic_examples(base, len(base) * scale, seed=scale)
+        r = bench(examples, queries)
+        for bs in (1, 64):
+            old, new = r[bs]
+            print(f"{len(examples):>9} {r['nodes']:>8} {r['max_depth']:>5} {bs:>5} {old:>19.1f} {new:>10.1f} {old / new:>7.1f}x")
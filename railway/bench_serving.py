@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import numpy as np
+import aiohttp
+
+# Carga de /predict em rajadas, como um carregamento de página: a cada --interval ms chegam
+# --burst requisições simultâneas (um elemento cada). Mede vazão, latência p50/p95/p99 e
+# quantas voltaram 503. Serve para comparar "gunicorn app:app" com o modo app_async.py.
+# Uso: python bench_serving.py --url http://127.0.0.1:8080 [--burst 32] [--interval 50] [--duration 20]
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+async def _one(session, url, features, latencies, statuses):
+    t0 = time.perf_counter()
+    try:
+        async with session.post(url + "/predict", json=features) as resp:
+            await resp.read()
+            statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            if resp.status == 200:
+                latencies.append((time.perf_counter() - t0) * 1000)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+
+async def run(args):
+    with open(args.examples, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    rnd = random.Random(42)
+    latencies, statuses, tasks = [], {}, []
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Aquecimento: carrega os modelos antes de medir
+        await _one(session, args.url, examples[0], [], {})
+        t0 = time.perf_counter()
+        next_burst = t0
+        while time.perf_counter() - t0 < args.duration:
+            for _ in range(args.burst):
+                # Variação no texto: sem isso o cache de predições responde quase tudo
+                features = dict(rnd.choice(examples), text=f"{rnd.choice(examples).get('text', '')} {rnd.random()}")
+                tasks.append(asyncio.ensure_future(_one(session, args.url, features, latencies, statuses)))
+            next_burst += args.interval / 1000
+            await asyncio.sleep(max(0.0, next_burst - time.perf_counter()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+    return {
+        "sent": len(tasks),
+        "ok_per_s": round(len(latencies) / elapsed, 1),
+        "latency": percentiles(latencies),
+        "status": statuses,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--examples", default="ux_examples.json")
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--interval", type=float, default=50, help="ms entre rajadas")
+    parser.add_argument("--duration", type=float, default=20, help="segundos")
+    parser.add_argument("--timeout", type=float, default=30, help="timeout por requisição (s)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
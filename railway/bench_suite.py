@@ -0,0 +1,195 @@
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Benchmark de ponta a ponta, offline, em corpora sintéticos de 1x/10x/100x o ux_examples.json:
+#   treino:   duração de cada etapa do train_and_save_model e pico de RSS
+#   predição: cold start (import + carga dos artefatos), p50/p95/p99 por etapa da cascata,
+#             vazão do predict_sessions em lote e pico de RSS
+# Cada medição roda num processo novo, num diretório temporário, com o GitHub trocado pelo
+# backend local (STORAGE_BACKEND=local) e o cache de predições desligado.
+# O resultado vai para um JSON, para comparar versões (ex.: diff entre dois commits).
+# Uso: python bench_suite.py --sbert /caminho/do/modelo [--scales 1,10,100] [--out bench_results.json]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def perturb(example, rnd, n):
+    # Variação plausível do mesmo elemento: mesma sessão, texto/classes/posição um pouco diferentes
+    ex = copy.deepcopy(example)
+    words = (ex.get("text") or "").split()
+    if words and rnd.random() < 0.5:
+        words[rnd.randrange(len(words))] = f"v{rnd.randrange(n)}"
+    ex["text"] = " ".join(words)
+    classes = (ex.get("class") or "").split()
+    if rnd.random() < 0.3:
+        classes.append(f"c{rnd.randrange(max(n // 10, 1))}")
+    ex["class"] = " ".join(classes)
+    if isinstance(ex.get("y"), (int, float)):
+        ex["y"] = round(ex["y"] * rnd.uniform(0.8, 1.2))
+    if isinstance(ex.get("siblingIndex"), int):
+        ex["siblingIndex"] = max(0, ex["siblingIndex"] + rnd.choice((-1, 0, 0, 1)))
+    return ex
+
+def synthetic_examples(examples, n, seed):
+    rnd = random.Random(seed)
+    return list(examples) + [perturb(rnd.choice(examples), rnd, n) for _ in range(n - len(examples))]
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def child_train():
+    from train_ux import train_and_save_model
+    stages = {}
+    current = {}
+    def progress(stage, fraction):
+        now = time.perf_counter()
+        if current.get("stage") != stage:
+            if current:
+                stages[current["stage"]] = round(now - current["t"], 3)
+            current.update(stage=stage, t=now)
+    t0 = time.perf_counter()
+    train_and_save_model("examples.json", progress=progress)
+    now = time.perf_counter()
+    stages[current["stage"]] = round(now - current["t"], 3)
+    return {"duration_s": round(now - t0, 3), "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+def child_predict(batch_size):
+    t0 = time.perf_counter()
+    import model_predict
+    t1 = time.perf_counter()
+    model_predict._load_all()
+    t2 = time.perf_counter()
+    with open("queries.json", "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    model_predict.predict_sessions([queries[0]])
+    t3 = time.perf_counter()
+
+    stage_ms = {name: [] for name, _, _ in model_predict.STAGES}
+    total_ms = []
+    answered = {name: 0 for name in stage_ms}
+    for q in queries:
+        s = time.perf_counter()
+        result = model_predict.predict_sessions([q])[0]
+        total_ms.append((time.perf_counter() - s) * 1000)
+        for name, ms in result["timings"].items():
+            stage_ms[name].append(ms)
+        answered[result["stage"]] += 1
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    s = time.perf_counter()
+    for batch in batches:
+        model_predict.predict_sessions(batch)
+    batch_s = time.perf_counter() - s
+    return {
+        "cold_start": {"import_s": round(t1 - t0, 3), "load_s": round(t2 - t1, 3),
+                       "first_predict_ms": round((t3 - t2) * 1000, 3)},
+        "single": {"total": percentiles(total_ms), "stages": {k: percentiles(v) for k, v in stage_ms.items()},
+                   "answered_by": answered},
+        "batch": {"batch_size": batch_size, "elements_per_s": round(len(queries) / batch_s, 1),
+                  "ms_per_element": round(batch_s * 1000 / len(queries), 4)},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_child(mode, workdir, env, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--batch-size", str(args.batch_size)]
+    proc = subprocess.run(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise RuntimeError(f"benchmark {mode} falhou em {workdir}")
+    # O resultado é a última linha do stdout (o resto são os logs do treino/predição)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(args):
+    with open(args.examples, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "sbert_model": args.sbert,
+            "base_examples": len(base),
+            "queries": args.queries,
+        },
+        "scales": {},
+    }
+    for scale in [int(s) for s in args.scales.split(",")]:
+        workdir = tempfile.mkdtemp(prefix=f"bench_{scale}x_")
+        try:
+            n = len(base) * scale
+            with open(os.path.join(workdir, "examples.json"), "w", encoding="utf-8") as f:
+                json.dump(synthetic_examples(base, n, seed=scale), f, ensure_ascii=False)
+            rnd = random.Random(1000 + scale)
+            queries = [perturb(rnd.choice(base), rnd, n) for _ in range(args.queries)]
+            with open(os.path.join(workdir, "queries.json"), "w", encoding="utf-8") as f:
+                json.dump(queries, f, ensure_ascii=False)
+            env = dict(os.environ,
+                       PYTHONPATH=HERE + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                       STORAGE_BACKEND="local",
+                       STORAGE_LOCAL_DIR=os.path.join(workdir, "storage_local"),
+                       SBERT_MODEL_NAME=args.sbert,
+                       SBERT_MODEL_DIR=os.path.join(workdir, "sbert_model"),
+                       PREDICTION_CACHE_ENTRIES="0",
+                       PREDICTION_CACHE_SHARED="",
+                       HF_HUB_OFFLINE="1")
+            print(f"[bench] {scale}x ({n} exemplos): treino...", flush=True)
+            train = run_child("train", workdir, env, args)
+            print(f"[bench] {scale}x: treino {train['duration_s']}s {train['stages']}", flush=True)
+            predict = run_child("predict", workdir, env, args)
+            print(f"[bench] {scale}x: predição p50 {predict['single']['total'].get('p50_ms')}ms, "
+                  f"p99 {predict['single']['total'].get('p99_ms')}ms, "
+                  f"lote {predict['batch']['elements_per_s']}/s", flush=True)
+            results["scales"][f"{scale}x"] = {"examples": n, "train": train, "predict": predict}
+        finally:
+            if args.keep:
+                print(f"[bench] artefatos mantidos em {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"[bench] resultados em {args.out}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", default=os.path.join(HERE, "ux_examples.json"))
+    parser.add_argument("--scales", default="1,10,100")
+    parser.add_argument("--sbert", default=os.getenv("SBERT_MODEL_NAME", "all-MiniLM-L6-v2"),
+                        help="caminho local do modelo SentenceTransformer (o benchmark não baixa nada)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--keep", action="store_true", help="mantém os diretórios de trabalho")
+    parser.add_argument("--child", choices=("train", "predict"))
+    args = parser.parse_args()
+    if args.child == "train":
+        print(json.dumps(child_train()))
+    elif args.child == "predict":
+        print(json.dumps(child_predict(args.batch_size)))
+    else:
+        main(args)
@@ -0,0 +1,60 @@
+import json
+import random
+import sys
+import time
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from model_predict import flatten_features
+
+# Benchmark do fallback TF-IDF: latência por requisição conforme o corpus cresce.
+# "antigo" = transform do corpus inteiro a cada /predict; "novo" = matriz pré-computada + produto esparso.
+# Uso: python bench_tfidf.py [ux_examples.json] [tamanhos separados por vírgula]
+
+def synthetic_texts(examples, n, seed=42):
+    rnd = random.Random(seed)
+    base = [flatten_features(ex).split() for ex in examples]
+    texts = []
+    for i in range(n):
+        words = list(rnd.choice(base))
+        # Perturba algumas palavras para o vocabulário crescer junto com o corpus
+        for _ in range(max(1, len(words) // 8)):
+            words[rnd.randrange(len(words))] = f"tok{rnd.randrange(n)}"
+        texts.append(" ".join(words))
+    return texts
+
+def _per_request_ms(fn, queries, budget_s):
+    # Repete até estourar o orçamento de tempo (o caminho antigo chega a segundos por chamada)
+    n = 0
+    t0 = time.perf_counter()
+    while n < len(queries) and (n == 0 or time.perf_counter() - t0 < budget_s):
+        fn(queries[n])
+        n += 1
+    return (time.perf_counter() - t0) * 1000 / n
+
+def bench(texts, queries, budget_s=3.0):
+    tfidf = TfidfVectorizer()
+    matrix = tfidf.fit_transform(texts).tocsc()
+
+    def old(q):
+        sims = cosine_similarity(tfidf.transform([q]), tfidf.transform(texts))[0]
+        return int(np.argmax(sims))
+
+    def new(q):
+        sims = (tfidf.transform([q]) @ matrix.T).toarray().ravel()
+        return int(np.argmax(sims))
+
+    return _per_request_ms(old, queries, budget_s), _per_request_ms(new, queries, budget_s)
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "ux_examples.json"
+    sizes = [int(x) for x in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1000, 10000, 100000]
+    with open(path, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    queries = [flatten_features(ex) for ex in examples]
+    print(f"{'exemplos':>10} {'antigo (ms)':>12} {'novo (ms)':>10} {'speedup':>8}")
+    for n in sizes:
+        texts = synthetic_texts(examples, n)
+        old_ms, new_ms = bench(texts, queries * 10)
+        print(f"{n:>10} {old_ms:>12.2f} {new_ms:>10.3f} {old_ms / new_ms:>7.0f}x")
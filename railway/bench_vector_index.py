@@ -0,0 +1,47 @@
+import sys
+import time
+import numpy as np
+
+from vector_index import ExactIndex, IVFIndex
+
+# Recall x latência do índice IVF contra a busca exata, em embeddings sintéticos
+# agrupados (dimensão do all-MiniLM-L6-v2). Uma consulta por vez, como no /predict.
+# Uso: python bench_vector_index.py [n_linhas] [n_consultas]
+
+def synthetic(n, dim=384, n_clusters=500, seed=42):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(n_clusters, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+def run(index, queries, k, **kwargs):
+    ids = []
+    t0 = time.perf_counter()
+    for q in queries:
+        ids.append(index.search(q[None, :], k=k, **kwargs)[0][0])
+    return np.array(ids), (time.perf_counter() - t0) * 1000 / len(queries)
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    k = 10
+    matrix = synthetic(n)
+    rng = np.random.default_rng(7)
+    queries = matrix[rng.integers(n, size=n_queries)] + 0.3 * rng.standard_normal((n_queries, matrix.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = ExactIndex(matrix)
+    truth, exact_ms = run(exact, queries, k)
+    t0 = time.perf_counter()
+    ivf = IVFIndex.build(matrix)
+    build_s = time.perf_counter() - t0
+    print(f"{n} linhas, {len(ivf.centroids)} listas IVF (build {build_s:.1f}s), {n_queries} consultas, k={k}")
+    print(f"{'busca':>12} {'ms/consulta':>12} {'recall@1':>9} {'recall@10':>10}")
+    print(f"{'exata':>12} {exact_ms:>12.3f} {1.0:>9.3f} {1.0:>10.3f}")
+    for nprobe in (1, 4, 8, 16, 32, 64):
+        found, ms = run(ivf, queries, k, nprobe=nprobe)
+        r1 = np.mean(found[:, 0] == truth[:, 0])
+        print(f"{'ivf/' + str(nprobe):>12} {ms:>12.3f} {r1:>9.3f} {recall(found, truth):>10.3f}")
@@ -0,0 +1,71 @@
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+from featurizer import flatten_features
+
+# Confere o encoder enxuto (fp32 e int8) contra o SentenceTransformer original:
+#   - cosseno entre os embeddings de cada exemplo
+#   - concordância do rótulo do vizinho mais próximo (leave-one-out) com o fp32
+#   - latência de encode (1 texto e lote) e tempo de cold start (processo novo: import + carga)
+# Uso: python check_sbert_encoder.py [diretório do modelo] [ux_examples.json]
+
+COLD_START = {
+    "sentence_transformers": "from sentence_transformers import SentenceTransformer; m = SentenceTransformer({d!r}, device='cpu')",
+    "enxuto fp32": "from sbert_encoder import SbertEncoder; m = SbertEncoder({d!r}, quantize=False)",
+    "enxuto int8": "from sbert_encoder import SbertEncoder; m = SbertEncoder({d!r}, quantize=True)",
+}
+
+def cold_start(code):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code + "; m.encode(['aquecimento'])"], check=True)
+    return time.perf_counter() - t0
+
+def loo_labels(emb, labels):
+    sims = emb @ emb.T
+    np.fill_diagonal(sims, -np.inf)
+    return [labels[i] for i in np.argmax(sims, axis=1)]
+
+def latency_ms(model, texts, repeat=20):
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        model.encode([texts[i % len(texts)]], normalize_embeddings=True)
+    single = (time.perf_counter() - t0) * 1000 / repeat
+    t0 = time.perf_counter()
+    model.encode(texts, normalize_embeddings=True)
+    return single, (time.perf_counter() - t0) * 1000 / len(texts)
+
+if __name__ == "__main__":
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else "sbert_model"
+    examples_path = sys.argv[2] if len(sys.argv) > 2 else "ux_examples.json"
+    with open(examples_path, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    texts = [flatten_features(ex) for ex in examples]
+    labels = [ex["sessao"] for ex in examples]
+
+    import torch
+    torch.set_num_threads(1)
+    from sentence_transformers import SentenceTransformer
+    from sbert_encoder import SbertEncoder
+    models = {
+        "sentence_transformers": SentenceTransformer(model_dir, device="cpu"),
+        "enxuto fp32": SbertEncoder(model_dir, quantize=False),
+        "enxuto int8": SbertEncoder(model_dir, quantize=True),
+    }
+    ref = models["sentence_transformers"].encode(texts, normalize_embeddings=True)
+    ref_nn = loo_labels(ref, labels)
+    print(f"{len(texts)} exemplos, modelo {model_dir}")
+    print(f"{'encoder':>22} {'cos médio':>10} {'cos mín':>8} {'NN = fp32':>10} {'NN = rótulo':>12} "
+          f"{'ms/1 texto':>11} {'ms/texto lote':>14} {'cold start s':>13}")
+    for name, model in models.items():
+        emb = model.encode(texts, normalize_embeddings=True)
+        cos = np.sum(emb * ref, axis=1)
+        nn_labels = loo_labels(emb, labels)
+        agree = np.mean([a == b for a, b in zip(nn_labels, ref_nn)])
+        acc = np.mean([a == b for a, b in zip(nn_labels, labels)])
+        single, batch = latency_ms(model, texts)
+        cold = cold_start(COLD_START[name].format(d=model_dir))
+        print(f"{name:>22} {cos.mean():>10.5f} {cos.min():>8.5f} {agree:>10.3f} {acc:>12.3f} "
+              f"{single:>11.2f} {batch:>14.2f} {cold:>13.2f}")
@@ -0,0 +1,118 @@
+import numpy as np
+
+# RandomForest do sklearn achatado em arrays NumPy, para a etapa RF da predição:
+#   feature, threshold, children (esquerda/direita) e value (probabilidades da folha)
+#   de todas as árvores concatenados; roots = nó raiz de cada árvore.
+# A travessia anda todas as árvores de todas as linhas juntas, um nível por iteração
+# (folhas apontam para si mesmas, então quem já chegou fica parado). A entrada pode ser
+# a lista de índices de tokens de cada linha (features binárias do Featurizer): só os tokens
+# que aparecem em algum split viram colunas (uma fração do vocabulário, limitada pelo tamanho
+# da floresta), sem matriz linhas x vocabulário nem CSR/validação/joblib do sklearn.
+# Resultado bit a bit igual ao predict_proba do sklearn: mesma comparação
+# (float32 <= threshold float64), mesmas probabilidades de folha, soma na ordem das árvores.
+
+class CompiledForest:
+    def __init__(self, feature, threshold, children, value, roots, n_features, max_depth):
+        # Índices em intp: indexar com int32 custa uma conversão a cada gather
+        self.feature = feature.astype(np.intp)
+        self.threshold = threshold
+        self.children = children.astype(np.intp).ravel()  # [2*nó] = esquerda, [2*nó + 1] = direita
+        self.is_leaf = self.children[0::2] == np.arange(len(self.feature))
+        self.value = value
+        self.roots = roots.astype(np.intp)
+        self.n_features = int(n_features)
+        self.max_depth = int(max_depth)
+        self.n_classes = value.shape[1]
+        # Features binárias: [2*nó] = filho com o token ausente (0.0), [2*nó + 1] = com ele presente (1.0)
+        nodes = np.arange(len(self.feature))
+        self.binary_children = np.stack([self.children[2 * nodes + (np.float32(0.0) > threshold)],
+                                         self.children[2 * nodes + (np.float32(1.0) > threshold)]], axis=1).ravel()
+        # Coluna compacta de cada token usado em split; os demais caem numa coluna que nenhum nó lê
+        used = np.unique(self.feature[~self.is_leaf])
+        self.token_slot = np.full(self.n_features, len(used), dtype=np.intp)
+        self.token_slot[used] = np.arange(len(used))
+        self.node_slot = self.token_slot[self.feature]
+        self.n_slots = len(used) + 1
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            ids = np.arange(n)
+            leaf = tree.children_left == -1
+            left = np.where(leaf, ids, tree.children_left) + offset
+            right = np.where(leaf, ids, tree.children_right) + offset
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            children.append(np.stack([left, right], axis=1).astype(np.int32))
+            value = tree.value[:, 0, :forest.n_classes_].astype(np.float64)
+            sums = value.sum(axis=1)
+            if not np.allclose(sums, 1.0):
+                # sklearn < 1.4 guarda contagens e normaliza no predict_proba da árvore
+                sums[sums == 0.0] = 1.0
+                value = value / sums[:, None]
+            values.append(value)
+            roots.append(offset)
+            offset += n
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(children),
+                   np.concatenate(values), np.array(roots, dtype=np.int32), forest.n_features_in_,
+                   max(est.tree_.max_depth for est in forest.estimators_))
+
+    def save(self, path):
+        np.savez(path, feature=self.feature.astype(np.int32), threshold=self.threshold,
+                 children=self.children.astype(np.int32).reshape(-1, 2), value=self.value,
+                 roots=self.roots.astype(np.int32), n_features=np.array(self.n_features),
+                 max_depth=np.array(self.max_depth))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["feature"], data["threshold"], data["children"], data["value"], data["roots"],
+                   data["n_features"], data["max_depth"])
+
+    def _leaves(self, n, width, step):
+        # -> (n, n_trees) índice da folha de cada árvore. step(base, nó) dá o próximo nó de cada par,
+        # com base = linha * width (início da linha na matriz achatada).
+        # Tudo achatado em 1D (linha x árvore): menos overhead por operação que o fancy indexing 2D.
+        # A cada 4 níveis tira quem já chegou na folha (as árvores têm profundidades bem diferentes).
+        n_trees = len(self.roots)
+        base = np.repeat(np.arange(n) * width, n_trees)
+        node = np.tile(self.roots, n)
+        active = np.arange(len(node))
+        cur = node
+        for depth in range(self.max_depth):
+            cur = step(base, cur)
+            if depth % 4 == 3 or depth == self.max_depth - 1:
+                node[active] = cur
+                keep = ~self.is_leaf[cur]
+                if not keep.any():
+                    break
+                active, cur, base = active[keep], cur[keep], base[keep]
+        return node.reshape(n, n_trees)
+
+    def predict_proba(self, X):
+        # X: matriz (densa ou esparsa) como a do Featurizer
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        x = np.asarray(X, dtype=np.float32)
+        flat, feature, threshold, children = x.ravel(), self.feature, self.threshold, self.children
+        return self._proba(self._leaves(
+            x.shape[0], self.n_features,
+            lambda base, cur: children[2 * cur + (flat[base + feature[cur]] > threshold[cur])]))
+
+    def predict_proba_indices(self, rows):
+        # rows: índices das features presentes (valor 1) de cada linha.
+        # Matriz linhas x colunas compactas em uint8: o 0/1 já escolhe o filho em binary_children.
+        X = np.zeros(len(rows) * self.n_slots, dtype=np.uint8)
+        X[np.concatenate([self.token_slot[np.asarray(idx, dtype=np.intp)] + i * self.n_slots
+                          for i, idx in enumerate(rows)] + [np.empty(0, dtype=np.intp)])] = 1
+        node_slot, binary_children = self.node_slot, self.binary_children
+        return self._proba(self._leaves(
+            len(rows), self.n_slots, lambda base, cur: binary_children[2 * cur + X[base + node_slot[cur]]]))
+
+    def _proba(self, leaves):
+        # Soma sequencial na ordem das árvores (cumsum), como o acumulador do sklearn
+        return np.cumsum(self.value[leaves], axis=1)[:, -1] / len(self.roots)
@@ -0,0 +1,254 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Log append-only de exemplos rotulados em segmentos JSONL:
+#   <root>/segment-<primeiro seq>.jsonl, uma linha {"seq", "hash", "ex"} por exemplo.
+# O hash é o mesmo critério de duplicado que o treino usava (json.dumps com sort_keys),
+# então um exemplo repetido é descartado na inserção. Ingestão custa O(lote), não O(corpus):
+# cada processo guarda o offset até onde já leu e, sob o flock, só lê o que outros
+# workers acrescentaram desde então. Como nada é reescrito, só entram exemplos válidos
+# (objeto com "sessao"); uma linha cortada por um crash é truncada ao abrir o store.
+# Segmentos fecham ao passar de SEGMENT_MAX_BYTES e nunca são fundidos nem reescritos.
+
+EXAMPLE_STORE_DIR = os.getenv("EXAMPLE_STORE_DIR", "example_store")
+SEGMENT_MAX_BYTES = int(os.getenv("SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+# Intervalo (s) do export em lote do snapshot para o GitHub
+EXPORT_INTERVAL = float(os.getenv("EXAMPLES_EXPORT_INTERVAL", "120"))
+
+def validate_example(example):
+    # None se o exemplo pode entrar no store; senão o motivo
+    if not isinstance(example, dict):
+        return f"esperado objeto, recebido {type(example).__name__}"
+    if not isinstance(example.get("sessao"), str) or not example["sessao"].strip():
+        return "campo 'sessao' ausente ou vazio"
+    return None
+
+def example_hash(example):
+    return hashlib.sha1(json.dumps(example, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _segment_first_seq(name):
+    return int(name[len("segment-"):-len(".jsonl")])
+
+def _line_seq(line):
+    # As linhas são json.dumps({"seq": ..., ...}): lê o seq do prefixo, sem decodificar o exemplo
+    if line.startswith(b'{"seq": '):
+        return int(line[8:line.index(b",", 8)])
+    return json.loads(line)["seq"]
+
+def _seek_after(f, after):
+    # Offset da primeira linha com seq > after (seqs crescentes no arquivo); busca binária por bytes
+    size = f.seek(0, os.SEEK_END)
+
+    def line_start(pos):
+        # Início da primeira linha que começa em pos ou depois
+        if pos == 0:
+            return 0
+        f.seek(pos - 1)
+        f.readline()
+        return f.tell()
+
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = line_start(mid)
+        if start >= size:
+            hi = mid
+            continue
+        f.seek(start)
+        line = f.readline()
+        if not line.endswith(b"\n") or _line_seq(line) > after:
+            hi = mid
+        else:
+            lo = start + len(line)
+    return line_start(lo)
+
+class ExampleStore:
+    def __init__(self, root=EXAMPLE_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hashes = set()
+        self._offsets = {}  # segmento -> bytes já lidos
+        self._last_seq = 0
+        self._exporter = None
+        self._repair()
+
+    def _segments(self):
+        return sorted(f for f in os.listdir(self.root) if f.startswith("segment-") and f.endswith(".jsonl"))
+
+    def _file_lock(self):
+        f = open(os.path.join(self.root, "store.lock"), "w")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _repair(self):
+        # Crash no meio de um append deixa uma linha sem "\n" no fim do último segmento;
+        # o próximo append grudaria nela. Sob o flock nenhuma escrita está em andamento.
+        lock_file = self._file_lock()
+        try:
+            segments = self._segments()
+            if not segments:
+                return
+            path = os.path.join(self.root, segments[-1])
+            with open(path, "rb+") as f:
+                end = f.seek(0, os.SEEK_END)
+                pos = end
+                while pos > 0:
+                    start = max(0, pos - 65536)
+                    f.seek(start)
+                    chunk = f.read(pos - start)
+                    nl = chunk.rfind(b"\n")
+                    if nl >= 0:
+                        pos = start + nl + 1
+                        break
+                    pos = start
+                if pos < end:
+                    f.truncate(pos)
+                    print(f"[Auto-UX] Example store: linha incompleta removida de {segments[-1]} ({end - pos} bytes)")
+        finally:
+            lock_file.close()
+
+    def _refresh(self):
+        # Lê só o que ainda não foi visto (linhas de outros workers ou de antes de abrir o store)
+        for seg in self._segments():
+            path = os.path.join(self.root, seg)
+            offset = self._offsets.get(seg, 0)
+            if os.path.getsize(path) <= offset:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # linha ainda sendo escrita
+                    offset += len(line)
+                    rec = json.loads(line)
+                    self._hashes.add(rec["hash"])
+                    self._last_seq = max(self._last_seq, rec["seq"])
+            self._offsets[seg] = offset
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            self._refresh()
+            return self._last_seq
+
+    def append(self, examples):
+        # Retorna quantos exemplos eram novos (duplicados são ignorados).
+        # Exemplo inválido -> ValueError e nada é gravado
+        for i, ex in enumerate(examples):
+            error = validate_example(ex)
+            if error:
+                raise ValueError(f"Exemplo {i} inválido: {error}")
+        with self._lock:
+            lock_file = self._file_lock()
+            try:
+                self._refresh()
+                lines = []
+                for ex in examples:
+                    h = example_hash(ex)
+                    if h in self._hashes:
+                        continue
+                    self._hashes.add(h)
+                    self._last_seq += 1
+                    lines.append(json.dumps({"seq": self._last_seq, "hash": h, "ex": ex}, ensure_ascii=False) + "\n")
+                if not lines:
+                    return 0
+                segments = self._segments()
+                seg = segments[-1] if segments else None
+                if seg is None or os.path.getsize(os.path.join(self.root, seg)) >= SEGMENT_MAX_BYTES:
+                    seg = f"segment-{self._last_seq - len(lines) + 1:012d}.jsonl"
+                path = os.path.join(self.root, seg)
+                data = "".join(lines).encode("utf-8")
+                with open(path, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._offsets[seg] = self._offsets.get(seg, 0) + len(data)
+                return len(lines)
+            finally:
+                lock_file.close()
+
+    def iter_records(self, after=0):
+        # Gera {"seq", "hash", "ex"} com seq > after, em ordem, lendo linha a linha (memória constante).
+        # O cursor não lê o que vem antes: o nome do segmento (primeiro seq) escolhe onde começar e
+        # uma busca binária por bytes acha a linha dentro dele; só os registros depois do cursor
+        # passam pelo json.loads.
+        segments = self._segments()
+        start = 0
+        for i, seg in enumerate(segments):
+            if _segment_first_seq(seg) <= after + 1:
+                start = i
+        for i, seg in enumerate(segments[start:]):
+            with open(os.path.join(self.root, seg), "rb") as f:
+                if i == 0 and after > 0:
+                    f.seek(_seek_after(f, after))
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    rec = json.loads(line)
+                    if rec["seq"] > after:
+                        yield rec
+
+    def iter_examples(self):
+        for rec in self.iter_records():
+            yield rec["ex"]
+
+    def export_json(self, path, indent=None):
+        # Snapshot no formato antigo (lista JSON), escrito de forma atômica e em streaming
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, ex in enumerate(self.iter_examples()):
+                f.write(",\n" if i else "\n")
+                f.write(json.dumps(ex, ensure_ascii=False, indent=indent))
+            f.write("\n]")
+        os.replace(tmp, path)
+
+    def export_to_github(self, filename="ux_examples.json"):
+        # Sobe o snapshot se houve exemplos novos desde o último export (de qualquer worker)
+        from git_utils import get_file_from_github, save_file_to_github
+        marker = os.path.join(self.root, "exported_seq")
+        lock_file = open(os.path.join(self.root, "export.lock"), "w")
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # outro worker já está exportando
+            last_seq = self.last_seq
+            exported = 0
+            if os.path.exists(marker):
+                with open(marker) as f:
+                    exported = int(f.read())
+            if last_seq <= exported:
+                return False
+            snapshot = os.path.join(self.root, "snapshot.json")
+            self.export_json(snapshot, indent=2)
+            with open(snapshot, "rb") as f:
+                content = f.read()
+            _, sha = get_file_from_github(filename)
+            status, resp = save_file_to_github(filename, content, "Incrementa exemplos UX", sha=sha)
+            print(f"[Auto-UX] Export do snapshot (seq {last_seq}) para o GitHub: status {status}")
+            if status not in (200, 201):
+                return False
+            with open(marker, "w") as f:
+                f.write(str(last_seq))
+            return True
+        finally:
+            lock_file.close()
+
+    def start_exporter(self, interval=EXPORT_INTERVAL):
+        if self._exporter is not None:
+            return
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.export_to_github()
+                except Exception as e:
+                    print("[Auto-UX] ERRO no export de exemplos:", e)
+        self._exporter = threading.Thread(target=loop, name="examples-export", daemon=True)
+        self._exporter.start()
@@ -0,0 +1,74 @@
+import numpy as np
+from scipy import sparse
+
+# Featurização compartilhada por train_ux.py e model_predict.py:
+# texto achatado (SBERT/TF-IDF) e tokens binários esparsos (RandomForest).
+
+def flatten_features(example):
+    text_parts = [
+        example.get('text',''),
+        example.get('tag',''),
+        example.get('id',''),
+        example.get('class',''),
+        example.get('selector',''),
+        str(example.get('contextHeadings',[])),
+    ]
+    for p in example.get('parents',[]):
+        text_parts.append(p.get('text',''))
+        text_parts.append(p.get('selector',''))
+    return " | ".join([str(x) for x in text_parts if x])
+
+def extract_tokens(features):
+    tokens = []
+    for k in ['class', 'text', 'id', 'tag', 'selector', 'role', 'type', 'placeholder', 'href', 'title', 'alt']:
+        val = features.get(k, "")
+        if isinstance(val, str):
+            tokens += [w.lower() for w in val.split() if len(w) > 1]
+    if 'parents' in features:
+        for p in features['parents']:
+            for k in ['class', 'text', 'id', 'tag', 'selector']:
+                val = p.get(k, "")
+                if isinstance(val, str):
+                    tokens += [w.lower() for w in val.split() if len(w) > 1]
+    if 'contextHeadings' in features and features['contextHeadings']:
+        for h in features['contextHeadings']:
+            tokens += [w.lower() for w in h.split() if len(w) > 1]
+    if 'y' in features: tokens.append(f'y{int(features['y']//10)*10}')
+    if 'siblingIndex' in features: tokens.append(f'sib{min(int(features['siblingIndex']), 10)}')
+    if 'width' in features: tokens.append(f'w{int(features['width']//50)*50}')
+    if 'height' in features: tokens.append(f'h{int(features['height']//20)*20}')
+    if 'depth' in features: tokens.append(f'd{min(int(features['depth']), 10)}')
+    if 'clickable' in features: tokens.append(f'click{features['clickable']}')
+    return tokens
+
+def build_vocab(examples):
+    vocab = set()
+    for ex in examples:
+        tokens = extract_tokens(ex)
+        vocab.update(tokens)
+    return sorted(vocab)
+
+
+class Featurizer:
+    # Vocabulário -> índice por token: cada exemplo vira uma linha CSR binária
+    # com custo proporcional aos seus tokens, não ao tamanho do vocabulário.
+    def __init__(self, vocab):
+        self.vocab = list(vocab)
+        self.index = {w: i for i, w in enumerate(self.vocab)}
+        self.n_features = len(self.vocab)
+
+    def token_indices(self, features):
+        index = self.index
+        return sorted({index[t] for t in extract_tokens(features) if t in index})
+
+    def transform(self, examples):
+        indptr = [0]
+        indices = []
+        for ex in examples:
+            indices.extend(self.token_indices(ex))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix(
+            (data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, self.n_features),
+        )
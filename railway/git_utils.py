@@ -1,6 +1,11 @@
 import requests
 import base64
+import hashlib
 import os
+import threading
+import time
+
+import metrics
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_OWNER = "guirofeoli"
@@ -9,52 +14,224 @@ GITHUB_BRANCH = "main"
 GITHUB_PATH = "railway/"
 GITHUB_API = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/contents/"
 
-def get_file_from_github(filename):
-    url = GITHUB_API + GITHUB_PATH + filename
-    params = {"ref": GITHUB_BRANCH}
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    resp = requests.get(url, headers=headers, params=params)
-    if resp.status_code == 200:
+# "github" (padrão) ou "local" (STORAGE_LOCAL_DIR, para testes e benchmarks offline).
+# GITHUB_API_URL permite apontar o backend github para um stand-in HTTP local da contents API.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "github")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "storage_local")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", GITHUB_API)
+# Por quantos segundos um arquivo em cache é servido sem nem revalidar com If-None-Match
+STORAGE_CACHE_TTL = float(os.getenv("STORAGE_CACHE_TTL", "5"))
+
+def _blob_sha(content):
+    # Mesmo sha que o GitHub devolve para o arquivo (hash do blob git)
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+class GitHubBackend:
+    name = "github"
+
+    def __init__(self, api_url=GITHUB_API_URL, path=GITHUB_PATH, branch=GITHUB_BRANCH, token=GITHUB_TOKEN):
+        self.api_url = api_url
+        self.path = path
+        self.branch = branch
+        # Session: reaproveita conexões TCP/TLS entre chamadas
+        self.session = requests.Session()
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+
+    # Retorna (status, content_bytes, sha, etag); 304 quando etag ainda vale (sem corpo)
+    def get(self, filename, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        resp = self.session.get(self.api_url + self.path + filename, headers=headers, params={"ref": self.branch})
+        if resp.status_code == 304:
+            return 304, None, None, etag
+        if resp.status_code != 200:
+            print(f"[git_utils] Falha ao baixar {filename}: {resp.status_code} {resp.text}")
+            return resp.status_code, None, None, None
         data = resp.json()
-        content = base64.b64decode(data["content"])
-        sha = data["sha"]
-        return content, sha
-    else:
-        print(f"[git_utils] Falha ao baixar {filename}: {resp.status_code} {resp.text}")
-        return None, None
+        return 200, base64.b64decode(data["content"]), data["sha"], resp.headers.get("ETag")
 
-def save_file_to_github(filename, content, commit_msg, sha=None, is_binary=False):
-    url = GITHUB_API + GITHUB_PATH + filename
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github+json"
-    }
-    if is_binary:
-        if isinstance(content, bytes):
-            b64_content = base64.b64encode(content).decode("utf-8")
-        else:
-            b64_content = content  # já está base64
+    def put(self, filename, b64_content, commit_msg, sha=None, encoding=None):
         payload = {
             "message": commit_msg,
             "content": b64_content,
-            "branch": GITHUB_BRANCH,
-            "encoding": "base64"
+            "branch": self.branch
         }
-    else:
-        if isinstance(content, str):
-            b64_content = base64.b64encode(content.encode("utf-8")).decode("utf-8")
+        if encoding:
+            payload["encoding"] = encoding
+        if sha:
+            payload["sha"] = sha
+        resp = self.session.put(self.api_url + self.path + filename, json=payload)
+        try:
+            return resp.status_code, resp.json()
+        except Exception:
+            return resp.status_code, {}
+
+    # Vários arquivos num único commit pela Git Data API (blobs -> tree -> commit -> ref).
+    # files: {filename: bytes}. Se a branch andou no meio, refaz sobre a ponta nova.
+    def commit(self, files, commit_msg, retries=3):
+        repo_url = self.api_url[:-len("contents/")] if self.api_url.endswith("contents/") else self.api_url
+        entries = []
+        for filename, content in files.items():
+            resp = self.session.post(repo_url + "git/blobs",
+                                     json={"content": base64.b64encode(content).decode("utf-8"), "encoding": "base64"})
+            if resp.status_code != 201:
+                print(f"[git_utils] Falha ao criar blob de {filename}: {resp.status_code} {resp.text}")
+                return resp.status_code, {}
+            entries.append({"path": self.path + filename, "mode": "100644", "type": "blob", "sha": resp.json()["sha"]})
+        for _ in range(retries):
+            resp = self.session.get(repo_url + f"git/ref/heads/{self.branch}")
+            if resp.status_code != 200:
+                return resp.status_code, {}
+            parent = resp.json()["object"]["sha"]
+            resp = self.session.get(repo_url + f"git/commits/{parent}")
+            if resp.status_code != 200:
+                return resp.status_code, {}
+            base_tree = resp.json()["tree"]["sha"]
+            resp = self.session.post(repo_url + "git/trees", json={"base_tree": base_tree, "tree": entries})
+            if resp.status_code != 201:
+                return resp.status_code, {}
+            tree = resp.json()["sha"]
+            if tree == base_tree:
+                return 200, {"commit": {"sha": parent}, "unchanged": True}
+            resp = self.session.post(repo_url + "git/commits",
+                                     json={"message": commit_msg, "tree": tree, "parents": [parent]})
+            if resp.status_code != 201:
+                return resp.status_code, {}
+            new_commit = resp.json()["sha"]
+            resp = self.session.patch(repo_url + f"git/refs/heads/{self.branch}", json={"sha": new_commit, "force": False})
+            if resp.status_code == 200:
+                return 201, {"commit": {"sha": new_commit}}
+            if resp.status_code != 422:  # 422 = não é fast-forward: outro commit entrou antes
+                return resp.status_code, {}
+        return 409, {"message": f"{self.branch} mudou durante o commit"}
+
+class LocalBackend:
+    # Mesma interface do GitHubBackend sobre um diretório local (sha/etag = hash do blob)
+    name = "local"
+
+    def __init__(self, root=STORAGE_LOCAL_DIR):
+        self.root = root
+
+    def get(self, filename, etag=None):
+        try:
+            with open(os.path.join(self.root, filename), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return 404, None, None, None
+        sha = _blob_sha(content)
+        if etag == sha:
+            return 304, None, None, etag
+        return 200, content, sha, sha
+
+    def put(self, filename, b64_content, commit_msg, sha=None, encoding=None):
+        path = os.path.join(self.root, filename)
+        current = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                current = _blob_sha(f.read())
+        # Mesmo contrato da contents API: atualizar exige o sha atual
+        if current is not None and sha != current:
+            return 409, {"message": f"{filename} does not match {sha}"}
+        content = base64.b64decode(b64_content)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+        return (200 if current else 201), {"content": {"sha": _blob_sha(content)}}
+
+    def commit(self, files, commit_msg):
+        # Sem histórico: cada arquivo é trocado atomicamente
+        for filename, content in files.items():
+            path = os.path.join(self.root, filename)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        return 201, {"files": {filename: _blob_sha(content) for filename, content in files.items()}}
+
+class StorageClient:
+    # Cache em memória por caminho + GET condicional (ETag): arquivo inalterado custa um 304,
+    # sem download nem base64. Escritas invalidam a entrada do arquivo.
+    def __init__(self, backend, ttl=STORAGE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._cache = {}  # filename -> (content, sha, etag, validado_em)
+        self._lock = threading.Lock()
+
+    def get_file(self, filename):
+        with self._lock:
+            cached = self._cache.get(filename)
+        if cached and time.time() - cached[3] < self.ttl:
+            return cached[0], cached[1]
+        t0 = time.perf_counter()
+        status, content, sha, etag = self.backend.get(filename, etag=cached[2] if cached else None)
+        self._observe("get", status, t0)
+        if status == 304 and cached:
+            with self._lock:
+                self._cache[filename] = cached[:3] + (time.time(),)
+            return cached[0], cached[1]
+        if status != 200:
+            self.invalidate(filename)
+            return None, None
+        with self._lock:
+            self._cache[filename] = (content, sha, etag, time.time())
+        return content, sha
+
+    def save_file(self, filename, content, commit_msg, sha=None, is_binary=False):
+        if is_binary and not isinstance(content, bytes):
+            b64_content = content  # já está base64
         else:
-            b64_content = base64.b64encode(content).decode("utf-8")
-        payload = {
-            "message": commit_msg,
-            "content": b64_content,
-            "branch": GITHUB_BRANCH
-        }
-    if sha:
-        payload["sha"] = sha
-
-    resp = requests.put(url, json=payload, headers=headers)
-    try:
-        return resp.status_code, resp.json()
-    except Exception:
-        return resp.status_code, {}
+            raw = content.encode("utf-8") if isinstance(content, str) else content
+            b64_content = base64.b64encode(raw).decode("utf-8")
+        t0 = time.perf_counter()
+        status, resp = self.backend.put(filename, b64_content, commit_msg, sha=sha,
+                                        encoding="base64" if is_binary else None)
+        self._observe("put", status, t0)
+        self.invalidate(filename)
+        return status, resp
+
+    def commit_files(self, files, commit_msg):
+        files = {name: content.encode("utf-8") if isinstance(content, str) else content
+                 for name, content in files.items()}
+        t0 = time.perf_counter()
+        status, resp = self.backend.commit(files, commit_msg)
+        self._observe("commit", status, t0)
+        for filename in files:
+            self.invalidate(filename)
+        return status, resp
+
+    def _observe(self, op, status, t0):
+        name = getattr(self.backend, "name", type(self.backend).__name__)
+        metrics.STORAGE_SECONDS.observe(time.perf_counter() - t0, name, op)
+        metrics.STORAGE_REQUESTS.inc(name, op, str(status))
+
+    def invalidate(self, filename=None):
+        with self._lock:
+            if filename is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(filename, None)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_storage_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            if STORAGE_BACKEND == "local":
+                backend = LocalBackend(STORAGE_LOCAL_DIR)
+            else:
+                backend = GitHubBackend()
+            _client = StorageClient(backend)
+        return _client
+
+def get_file_from_github(filename):
+    return get_storage_client().get_file(filename)
+
+def save_file_to_github(filename, content, commit_msg, sha=None, is_binary=False):
+    return get_storage_client().save_file(filename, content, commit_msg, sha=sha, is_binary=is_binary)
+
+def commit_files_to_github(files, commit_msg):
+    return get_storage_client().commit_files(files, commit_msg)
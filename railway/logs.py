@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+import random
+import sys
+
+# Log estruturado: uma linha JSON por evento ({"ts", "level", "event", ...campos}) no stdout.
+#   LOG_LEVEL: DEBUG, INFO (padrão), WARNING, ERROR
+#   LOG_PAYLOAD_SAMPLE: fração das requisições com o payload logado (nível DEBUG); 0 = nunca
+# Abaixo do nível o custo é só o isEnabledFor: o JSON nem é montado.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_PAYLOAD_SAMPLE = float(os.getenv("LOG_PAYLOAD_SAMPLE", "0.01"))
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+logger = logging.getLogger("auto_ux")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(_JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def _log(level, event, exc_info=False, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+def debug(event, **fields):
+    _log(logging.DEBUG, event, **fields)
+
+def info(event, **fields):
+    _log(logging.INFO, event, **fields)
+
+def warning(event, **fields):
+    _log(logging.WARNING, event, **fields)
+
+def error(event, exc_info=False, **fields):
+    _log(logging.ERROR, event, exc_info=exc_info, **fields)
+
+def sample_payload():
+    # True para uma amostra das requisições (e só se o DEBUG estiver ligado)
+    return LOG_PAYLOAD_SAMPLE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_PAYLOAD_SAMPLE
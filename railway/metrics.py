@@ -0,0 +1,209 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Métricas no formato texto do Prometheus, sem dependência externa.
+# No caminho quente cada observação é um bisect + incremento sob um lock por métrica (~1µs).
+# Com METRICS_DIR definido, cada processo (workers do gunicorn, processo de treino) grava
+# um snapshot em METRICS_DIR/<pid>.json a cada METRICS_FLUSH_INTERVAL s, e o /metrics de
+# qualquer worker soma contadores/histogramas de todos; gauges saem com o label pid
+# (só de processos vivos).
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_flusher = None
+
+class _Metric:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tupla de labels -> valor
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def snapshot(self):
+        with self._lock:
+            return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames),
+                    "values": [[list(k), _copy(v)] for k, v in self._values.items()]}
+
+def _copy(value):
+    return [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                # [contagem por bucket (não cumulativa, último = +Inf), soma, total]
+                v = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def snapshot(self):
+        snap = super().snapshot()
+        snap["buckets"] = list(self.buckets)
+        return snap
+
+# Predição
+PREDICT_STAGE_SECONDS = Histogram("autoux_predict_stage_seconds",
+                                  "Tempo de cada etapa da cascata por chamada de predict_sessions", ["stage"])
+PREDICT_ANSWERED = Counter("autoux_predict_answered_total",
+                           "Elementos respondidos por etapa da cascata (cache = cache de predições)", ["stage"])
+PREDICTION_CACHE = Gauge("autoux_prediction_cache", "Estado do cache de predições deste processo", ["field"])
+PREDICT_BATCH_SIZE = Histogram("autoux_predict_batch_size", "Elementos por lote do micro-batcher (modo asyncio)",
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+PREDICT_QUEUE_DEPTH = Gauge("autoux_predict_queue_depth", "Elementos esperando o micro-batcher")
+PREDICT_REJECTED = Counter("autoux_predict_rejected_total", "Requisições recusadas com 503 (fila de predição cheia ou atrasada)")
+MODEL_LOAD_SECONDS = Gauge("autoux_model_load_seconds", "Duração da última carga de cada modelo", ["model"])
+# HTTP
+REQUEST_SECONDS = Histogram("autoux_http_request_seconds", "Latência das rotas HTTP", ["route", "method", "status"])
+# Treino
+TRAIN_STAGE_SECONDS = Gauge("autoux_train_stage_seconds", "Duração de cada etapa do último treino", ["stage"])
+TRAIN_DURATION_SECONDS = Gauge("autoux_train_duration_seconds", "Duração total do último treino")
+TRAIN_JOBS = Counter("autoux_train_jobs_total", "Jobs de treino finalizados", ["status"])
+# Armazenamento (GitHub contents API ou backend local)
+STORAGE_SECONDS = Histogram("autoux_storage_request_seconds", "Latência das chamadas ao armazenamento",
+                            ["backend", "op"])
+STORAGE_REQUESTS = Counter("autoux_storage_requests_total", "Chamadas ao armazenamento por status HTTP",
+                           ["backend", "op", "status"])
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merged_snapshots():
+    # {nome: snapshot}, somando os arquivos dos outros processos quando METRICS_DIR está ativo
+    own = {m.name: m.snapshot() for m in _registry}
+    if not METRICS_DIR:
+        return own
+    merged = {}
+    sources = [(os.getpid(), own)]
+    try:
+        files = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        files = []
+    for fname in files:
+        if not fname.endswith(".json") or fname == f"{os.getpid()}.json":
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, fname), "r", encoding="utf-8") as f:
+                sources.append((int(fname[:-5]), json.load(f)))
+        except (OSError, ValueError):
+            continue  # arquivo sendo trocado ou inválido
+    multi = len(sources) > 1
+    for pid, snaps in sources:
+        alive = pid == os.getpid() or _pid_alive(pid)
+        for name, snap in snaps.items():
+            target = merged.setdefault(name, dict(snap, values={}))
+            for labels, value in snap["values"]:
+                if snap["kind"] == "gauge":
+                    if not alive:
+                        continue
+                    key = tuple(labels) + ((str(pid),) if multi else ())
+                    target["values"][key] = value
+                elif snap["kind"] == "counter":
+                    target["values"][tuple(labels)] = target["values"].get(tuple(labels), 0.0) + value
+                else:
+                    cur = target["values"].get(tuple(labels))
+                    if cur is None:
+                        target["values"][tuple(labels)] = _copy(value)
+                    else:
+                        cur[0] = [a + b for a, b in zip(cur[0], value[0])]
+                        cur[1] += value[1]
+                        cur[2] += value[2]
+            if snap["kind"] == "gauge" and multi:
+                target["labelnames"] = list(snap["labelnames"]) + ["pid"]
+    for snap in merged.values():
+        snap["values"] = [[list(k), v] for k, v in snap["values"].items()]
+    return merged
+
+def render():
+    lines = []
+    for name, snap in _merged_snapshots().items():
+        lines.append(f"# HELP {name} {snap['help']}")
+        lines.append(f"# TYPE {name} {snap['kind']}")
+        names = snap["labelnames"]
+        for labels, value in snap["values"]:
+            if snap["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {_fmt(value)}")
+                continue
+            counts, total, n = value
+            cumulative = 0
+            for bound, count in zip(list(snap["buckets"]) + [float("inf")], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, labels, [('le', _fmt(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_fmt(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {n}")
+    return "\n".join(lines) + "\n"
+
+def flush():
+    # Grava o snapshot deste processo para o /metrics dos outros (no-op sem METRICS_DIR)
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({m.name: m.snapshot() for m in _registry}, f)
+    os.replace(path + ".tmp", path)
+
+def start_flusher(interval=METRICS_FLUSH_INTERVAL):
+    global _flusher
+    if not METRICS_DIR or (_flusher is not None and _flusher.is_alive()):
+        return
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                flush()
+            except OSError as e:
+                print("[Auto-UX] Falha ao gravar métricas:", e)
+    _flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+    _flusher.start()
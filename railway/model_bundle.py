@@ -0,0 +1,178 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import time
+import zipfile
+import numpy as np
+
+# Pacote versionado com todos os artefatos do modelo num único arquivo (zip):
+#   manifest.json: {"format", "version", "created", "meta", "files": {nome: {"sha256", "size"}}}
+#   + os artefatos do treino (model.bin, tfidf_matrix.npz, bert_emb_matrix.npy, ...)
+# Gravado em <arquivo>.tmp e trocado com os.replace: quem lê vê o pacote antigo ou o novo
+# inteiro, nunca um meio-termo. Os .npy vão sem compressão (ZIP_STORED) para o
+# bert_emb_matrix.npy continuar sendo lido por mmap direto de dentro do zip.
+# O pacote é verificado por inteiro (sha256 de cada membro) uma vez, ao ser gravado, antes
+# de ser publicado ("verified": "write" no manifest). Na carga a verificação padrão só
+# calcula o sha256 dos membros pequenos; os .npy têm tamanho e cabeçalho conferidos (ler
+# a matriz inteira desfaria o mmap). verify="full" confere tudo.
+
+BUNDLE_FILE = os.getenv("MODEL_BUNDLE", "model_bundle.zip")
+BUNDLE_FORMAT = 1
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def write_bundle(paths, bundle_path=BUNDLE_FILE, meta=None):
+    # paths: artefatos locais (entram no zip pelo nome do arquivo). Retorna o manifest.
+    files = {os.path.basename(p): {"sha256": _sha256_file(p), "size": os.path.getsize(p)} for p in paths}
+    digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        # Mesmo conteúdo = mesmo sufixo; o prefixo de tempo ordena as versões
+        "version": f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{digest[:12]}",
+        "created": round(time.time(), 3),
+        "meta": meta or {},
+        "verified": "write",
+        "files": files,
+    }
+    tmp = bundle_path + ".tmp"
+    with zipfile.ZipFile(tmp, "w") as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=1), zipfile.ZIP_DEFLATED)
+        for p in paths:
+            compression = zipfile.ZIP_STORED if p.endswith((".npy", ".npz")) else zipfile.ZIP_DEFLATED
+            zf.write(p, os.path.basename(p), compress_type=compression)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    # Verificação completa antes de publicar: quem carrega pode confiar nos membros grandes
+    try:
+        ModelBundle(tmp, verify="full").close()
+    except Exception:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, bundle_path)
+    return manifest
+
+def _stamp(st):
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def file_stamp(path=BUNDLE_FILE):
+    # Identidade barata do arquivo (um stat): muda a cada os.replace. None se não existe.
+    try:
+        return _stamp(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+class ModelBundle:
+    def __init__(self, bundle_path=BUNDLE_FILE, verify=True):
+        self.path = bundle_path
+        # Fixa o inode aberto: um os.replace no meio da leitura não mistura versões
+        self._file = open(bundle_path, "rb")
+        self.stamp = _stamp(os.fstat(self._file.fileno()))
+        self._zip = zipfile.ZipFile(self._file)
+        self.manifest = json.loads(self._zip.read("manifest.json"))
+        if self.manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Formato de pacote não suportado: {self.manifest.get('format')}")
+        self.version = self.manifest["version"]
+        if verify:
+            self.verify(full=verify == "full")
+
+    def verify(self, full=False):
+        for name, info in self.manifest["files"].items():
+            if self._zip.getinfo(name).file_size != info["size"]:
+                raise ValueError(f"Tamanho inválido para {name} no pacote {self.version}")
+            if name.endswith(".npy") and not full:
+                shape, _, dtype, offset = self._npy_header(name)
+                if offset + int(np.prod(shape)) * dtype.itemsize != info["size"]:
+                    raise ValueError(f"Cabeçalho .npy inconsistente para {name} no pacote {self.version}")
+                continue
+            h = hashlib.sha256()
+            with self._zip.open(name) as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            if h.hexdigest() != info["sha256"]:
+                raise ValueError(f"Checksum inválido para {name} no pacote {self.version}")
+
+    def __contains__(self, name):
+        return name in self.manifest["files"]
+
+    def read(self, name):
+        return self._zip.read(name)
+
+    def open(self, name):
+        return self._zip.open(name)
+
+    def json(self, name):
+        return json.loads(self._zip.read(name))
+
+    def _npy_header(self, name):
+        # (shape, fortran, dtype, bytes do cabeçalho .npy) lidos de dentro do membro
+        with self._zip.open(name) as f:
+            major, _ = np.lib.format.read_magic(f)
+            if major == 1:
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            return shape, fortran, dtype, f.tell()
+
+    def npy_mmap(self, name):
+        # .npy sem compressão: mmap do arquivo do pacote no offset do membro
+        info = self._zip.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return np.load(io.BytesIO(self._zip.read(name)))
+        shape, fortran, dtype, npy_header = self._npy_header(name)
+        self._file.seek(info.header_offset)
+        header = _LOCAL_HEADER.unpack(self._file.read(_LOCAL_HEADER.size))
+        offset = info.header_offset + _LOCAL_HEADER.size + header[10] + header[11] + npy_header
+        return np.memmap(self._file, dtype=dtype, mode="r", offset=offset, shape=shape,
+                         order="F" if fortran else "C")
+
+    def close(self):
+        # Os memmaps já criados continuam válidos (têm o próprio mapeamento)
+        self._zip.close()
+        self._file.close()
+
+class LooseFiles:
+    # Mesma interface do ModelBundle sobre os arquivos soltos de treinos antigos
+    def __init__(self, root="."):
+        self.root = root
+        st = os.stat(os.path.join(root, "model.bin"))
+        self.stamp = _stamp(st)
+        self.version = f"{st.st_mtime_ns}-{st.st_size}"
+        self.manifest = None
+
+    def __contains__(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), "rb") as f:
+            return f.read()
+
+    def open(self, name):
+        return open(os.path.join(self.root, name), "rb")
+
+    def json(self, name):
+        with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def npy_mmap(self, name):
+        return np.load(os.path.join(self.root, name), mmap_mode="r")
+
+    def close(self):
+        pass
+
+def open_model_source(bundle_path=BUNDLE_FILE, verify=True):
+    # Pacote se existir; senão os arquivos soltos (deploys anteriores ao pacote)
+    if os.path.exists(bundle_path):
+        return ModelBundle(bundle_path, verify=verify)
+    return LooseFiles(os.path.dirname(bundle_path) or ".")
+
+def source_stamp(bundle_path=BUNDLE_FILE):
+    return file_stamp(bundle_path) or file_stamp(os.path.join(os.path.dirname(bundle_path) or ".", "model.bin"))
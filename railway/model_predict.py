@@ -1,143 +1,351 @@
 import json
 import joblib
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import base64, tarfile, io, os, shutil
-
-_model = None
-_vocab = None
-_labels = None
-_tfidf_model = None
-_all_texts = None
-_bert_emb_matrix = None
+from scipy import sparse
+import io, os, threading, time
+from functools import cached_property
+
+from featurizer import flatten_features, Featurizer
+from prediction_cache import PredictionCache, feature_key
+from vector_index import ExactIndex, load_index
+from model_bundle import BUNDLE_FILE, open_model_source, source_stamp
+from compiled_forest import CompiledForest
+from tfjs_model import tfjs_tokens
+import metrics
+
 _sbert_model = None
+_tfjs_model = None
+
+_prediction_cache = PredictionCache()
+
+# Vizinhos SBERT usados na votação (1 = vizinho mais próximo, como antes)
+SBERT_KNN = int(os.getenv("SBERT_KNN", "1"))
+# Diretório do modelo SBERT (carregado pelo encoder enxuto). Não vem no pacote do modelo:
+# se faltar, o worker baixa SBERT_MODEL_NAME (o mesmo modelo base do treino) e salva nele
+SBERT_MODEL_DIR = os.getenv("SBERT_MODEL_DIR", "sbert_model")
+SBERT_MODEL_NAME = os.getenv("SBERT_MODEL_NAME", "all-MiniLM-L6-v2")
+# De quantos em quantos segundos um worker confere (um stat) se há pacote novo; 0 desliga
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "5"))
+# Conferência do pacote na carga: "1" = sha256 dos membros pequenos + tamanho/cabeçalho dos .npy
+# (o pacote já foi verificado por inteiro ao ser gravado), "full" = sha256 de tudo, "0" = nada
+BUNDLE_VERIFY = {"0": False, "full": "full"}.get(os.getenv("BUNDLE_VERIFY", "1"), True)
+# Etapa RF pela floresta compilada (arrays NumPy, mesmas probabilidades); 0 = predict_proba do sklearn
+RF_COMPILED = os.getenv("RF_COMPILED", "1") == "1"
+# Diretório do classificador TF.js (model.json/model.weights.bin); vazio = etapa desligada
+TFJS_MODEL_DIR = os.getenv("TFJS_MODEL_DIR", "")
+# Exemplos usados para reconstruir o rótulo por exemplo de artefatos antigos (sem all_examples_labels.json)
+LEGACY_EXAMPLES_FILE = os.getenv("LEGACY_EXAMPLES_FILE", "ux_examples.json")
+
+class ModelState:
+    # Tudo o que vem de um treino. Os workers trocam o estado inteiro de uma vez
+    # (uma atribuição de _state); cada predição usa o estado que pegou no início.
+    def __init__(self, source):
+        self.version = source.version
+        self.stamp = source.stamp
+        t0 = time.perf_counter()
+        self.labels = source.json("labels.json")
+        if "all_examples_labels.json" in source:
+            self.example_labels = source.json("all_examples_labels.json")
+        else:
+            # Artefatos antigos não têm o rótulo por exemplo: reconstrói a partir dos exemplos
+            self.example_labels = _legacy_example_labels(source.json("all_examples_texts.json"))
+        # Peso de cada exemplo = quantos quase-duplicados ele representa (treinos antigos: 1)
+        if "all_examples_weights.json" in source:
+            self.example_weights = source.json("all_examples_weights.json")
+        else:
+            self.example_weights = [1] * len(self.example_labels)
+        # RF compilado (forest.npz do treino; artefatos antigos: compila o model.bin na carga)
+        self.model = self.forest = None
+        if RF_COMPILED and "forest.npz" in source:
+            self.forest = CompiledForest.load(io.BytesIO(source.read("forest.npz")))
+        else:
+            self.model = joblib.load(io.BytesIO(source.read("model.bin")))
+            if RF_COMPILED:
+                self.forest = CompiledForest.from_sklearn(self.model)
+        self.featurizer = Featurizer(source.json("allWords.json"))
+        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, "rf")
 
-def flatten_features(example):
-    text_parts = [
-        example.get('text',''),
-        example.get('tag',''),
-        example.get('id',''),
-        example.get('class',''),
-        example.get('selector',''),
-        str(example.get('contextHeadings',[])),
-    ]
-    for p in example.get('parents',[]):
-        text_parts.append(p.get('text',''))
-        text_parts.append(p.get('selector',''))
-    return " | ".join([str(x) for x in text_parts if x])
-
-def extract_tokens(features):
-    tokens = []
-    for k in ['class', 'text', 'id', 'tag', 'selector', 'role', 'type', 'placeholder', 'href', 'title', 'alt']:
-        val = features.get(k, "")
-        if isinstance(val, str):
-            tokens += [w.lower() for w in val.split() if len(w) > 1]
-    if 'parents' in features:
-        for p in features['parents']:
-            for k in ['class', 'text', 'id', 'tag', 'selector']:
-                val = p.get(k, "")
-                if isinstance(val, str):
-                    tokens += [w.lower() for w in val.split() if len(w) > 1]
-    if 'contextHeadings' in features and features['contextHeadings']:
-        for h in features['contextHeadings']:
-            tokens += [w.lower() for w in h.split() if len(w) > 1]
-    if 'y' in features: tokens.append(f'y{int(features['y']//10)*10}')
-    if 'siblingIndex' in features: tokens.append(f'sib{min(int(features['siblingIndex']), 10)}')
-    if 'width' in features: tokens.append(f'w{int(features['width']//50)*50}')
-    if 'height' in features: tokens.append(f'h{int(features['height']//20)*20}')
-    if 'depth' in features: tokens.append(f'd{min(int(features['depth']), 10)}')
-    if 'clickable' in features: tokens.append(f'click{features['clickable']}')
-    return tokens
-
-def build_vocab(examples):
-    vocab = set()
+        # SBERT/TF-IDF só carregam no primeiro uso (propriedades abaixo): o estado mantém a fonte
+        # aberta (o pacote fixa o inode, então a carga tardia lê a mesma versão)
+        self._source = source
+        self._lock = threading.Lock()
+
+    # cached_property não trava (3.12+): o lock do estado garante uma carga só por estado
+    @cached_property
+    def sbert_index(self):
+        with self._lock:
+            if "sbert_index" in self.__dict__:
+                return self.__dict__["sbert_index"]
+            source = self._source
+            t0 = time.perf_counter()
+            if "bert_emb_matrix.npy" in source:
+                # mmap: os workers do gunicorn compartilham as páginas pelo cache do SO
+                emb_matrix = source.npy_mmap("bert_emb_matrix.npy")
+            else:
+                # Artefatos antigos: JSON sem normalização
+                print("[Auto-UX] bert_emb_matrix.npy não encontrado, lendo bert_emb_matrix.json...")
+                emb = np.array(source.json("bert_emb_matrix.json"), dtype=np.float32)
+                emb_matrix = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            if "sbert_index.npz" in source:
+                index = load_index(io.BytesIO(source.read("sbert_index.npz")), emb_matrix)
+            else:
+                index = ExactIndex(emb_matrix)
+            metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, "sbert_index")
+            # Grava ainda sob o lock: quem esperava já encontra o valor
+            self.__dict__["sbert_index"] = index
+            return index
+
+    @cached_property
+    def tfidf(self):
+        # (vetorizador, matriz dos exemplos em CSC)
+        with self._lock:
+            if "tfidf" in self.__dict__:
+                return self.__dict__["tfidf"]
+            source = self._source
+            t0 = time.perf_counter()
+            model = joblib.load(io.BytesIO(source.read("model_tfidf.bin")))
+            if "tfidf_matrix.npz" in source:
+                matrix = sparse.load_npz(io.BytesIO(source.read("tfidf_matrix.npz"))).tocsc()
+            else:
+                # Artefatos antigos: calcula a matriz uma única vez por carga
+                print("[Auto-UX] tfidf_matrix.npz não encontrado, calculando a partir dos textos...")
+                matrix = model.transform(source.json("all_examples_texts.json")).tocsc()
+            metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, "tfidf")
+            self.__dict__["tfidf"] = (model, matrix)
+            return model, matrix
+
+def _legacy_example_labels(texts):
+    # Um rótulo por linha de all_examples_texts.json (labels.json é por classe, não por exemplo).
+    # O treino antigo removia duplicados exatos em ordem; com o arquivo inalterado, bate 1:1.
+    if not os.path.exists(LEGACY_EXAMPLES_FILE):
+        raise ValueError(f"all_examples_labels.json ausente e {LEGACY_EXAMPLES_FILE} não encontrado; retreine o modelo")
+    with open(LEGACY_EXAMPLES_FILE, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    seen, filtered = set(), []
     for ex in examples:
-        tokens = extract_tokens(ex)
-        vocab.update(tokens)
-    return sorted(vocab)
+        sig = json.dumps(ex, sort_keys=True)
+        if sig not in seen:
+            seen.add(sig)
+            filtered.append(ex)
+    if [flatten_features(ex) for ex in filtered] == texts:
+        return [ex["sessao"] for ex in filtered]
+    # Exemplos mudaram depois do treino: casa pelo texto
+    by_text = {}
+    for ex in filtered:
+        by_text.setdefault(flatten_features(ex), ex.get("sessao"))
+    missing = sum(1 for t in texts if by_text.get(t) is None)
+    if missing:
+        raise ValueError(f"all_examples_labels.json ausente e {missing} de {len(texts)} textos sem rótulo em "
+                         f"{LEGACY_EXAMPLES_FILE}; retreine o modelo")
+    print(f"[Auto-UX] all_examples_labels.json não encontrado, rótulos reconstruídos de {LEGACY_EXAMPLES_FILE}")
+    return [by_text[t] for t in texts]
 
-def example_to_vector(example, vocab):
-    tokens = set(extract_tokens(example))
-    return [1 if w in tokens else 0 for w in vocab]
+_state = None
+_state_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_next_check = 0.0
+_failed_stamp = None
 
-def load_sbert_base64(filename="sbert_model_b64.json"):
-    global _sbert_model
+def _load_state():
+    source = open_model_source(BUNDLE_FILE, verify=BUNDLE_VERIFY)
     try:
-        if os.path.exists(filename):
-            with open(filename, "r", encoding="utf-8") as f:
-                tar_b64 = json.load(f)["base64"]
-                tar_bytes = base64.b64decode(tar_b64)
-                tmpdir = "./sbert_tmp_model"
-                if os.path.exists(tmpdir):
-                    shutil.rmtree(tmpdir)
-                with tarfile.open(fileobj=io.BytesIO(tar_bytes), mode="r:gz") as tar:
-                    tar.extractall(tmpdir)
-                from sentence_transformers import SentenceTransformer
-                _sbert_model = SentenceTransformer(tmpdir + "/model")
-                print("[Auto-UX] SBERT carregado localmente!")
-        else:
-            # Baixa da HuggingFace direto se não existir local
+        # O estado fica com a fonte (cargas tardias); ela fecha quando o estado é descartado
+        return ModelState(source)
+    except Exception:
+        source.close()
+        raise
+
+def _swap_state(state):
+    global _state
+    old = _state
+    _state = state
+    # Versão nova invalida o cache de predições
+    _prediction_cache.set_version(state.version)
+    if old is not None:
+        print(f"[Auto-UX] Modelo trocado: {old.version} -> {state.version}")
+
+def _reload():
+    global _failed_stamp
+    try:
+        stamp = source_stamp(BUNDLE_FILE)
+        try:
+            state = _load_state()
+        except Exception as e:
+            # Pacote corrompido/incompleto: segue com o estado atual e não tenta de novo o mesmo arquivo
+            _failed_stamp = stamp
+            print("[Auto-UX] Erro ao recarregar o modelo, mantendo a versão atual:", e)
+            return
+        _swap_state(state)
+    finally:
+        _reload_lock.release()
+
+def _current_state():
+    global _next_check
+    state = _state
+    if state is None:
+        with _state_lock:
+            if _state is None:
+                _swap_state(_load_state())
+            return _state
+    if MODEL_RELOAD_INTERVAL > 0 and time.monotonic() >= _next_check:
+        _next_check = time.monotonic() + MODEL_RELOAD_INTERVAL
+        stamp = source_stamp(BUNDLE_FILE)
+        if stamp is not None and stamp != state.stamp and stamp != _failed_stamp \
+                and _reload_lock.acquire(blocking=False):
+            # Carrega em segundo plano; as requisições seguem com o estado atual até a troca
+            threading.Thread(target=_reload, name="model-reload", daemon=True).start()
+    return state
+
+def model_version():
+    return _current_state().version
+
+def _load_sbert():
+    # O encoder não muda entre treinos: fica fora do ModelState, carregado uma vez por worker
+    global _sbert_model
+    if _sbert_model is not None:
+        return _sbert_model
+    with _state_lock:
+        if _sbert_model is not None:
+            return _sbert_model
+        t0 = time.perf_counter()
+        try:
+            # Encoder enxuto (torch puro, int8): sobe bem mais rápido que o SentenceTransformer
+            from sbert_encoder import SbertEncoder, ensure_model_dir
+            _sbert_model = SbertEncoder(ensure_model_dir(SBERT_MODEL_DIR, SBERT_MODEL_NAME))
+            print(f"[Auto-UX] SBERT enxuto carregado de {SBERT_MODEL_DIR} em {time.perf_counter() - t0:.2f}s")
+        except Exception as e:
+            print("[Auto-UX] Erro no SBERT enxuto, usando SentenceTransformer:", e)
             from sentence_transformers import SentenceTransformer
-            print("[Auto-UX] SBERT não encontrado, baixando do HuggingFace...")
-            _sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
-    except Exception as e:
-        print("[Auto-UX] Erro ao carregar SBERT:", e)
-        from sentence_transformers import SentenceTransformer
-        _sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
+            has_dir = os.path.exists(os.path.join(SBERT_MODEL_DIR, "model.safetensors"))
+            _sbert_model = SentenceTransformer(SBERT_MODEL_DIR if has_dir else SBERT_MODEL_NAME)
+        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, "sbert")
     return _sbert_model
 
 def _load_all():
-    global _model, _vocab, _labels, _tfidf_model, _all_texts, _bert_emb_matrix, _sbert_model
-    if _model is None:
-        _model = joblib.load("model.bin")
-    if _vocab is None:
-        with open("allWords.json", "r", encoding="utf-8") as f:
-            _vocab = json.load(f)
-    if _labels is None:
-        with open("labels.json", "r", encoding="utf-8") as f:
-            _labels = json.load(f)
-    if _tfidf_model is None:
-        _tfidf_model = joblib.load("model_tfidf.bin")
-    if _all_texts is None:
-        with open("all_examples_texts.json", "r", encoding="utf-8") as f:
-            _all_texts = json.load(f)
-    if _bert_emb_matrix is None:
-        with open("bert_emb_matrix.json", "r", encoding="utf-8") as f:
-            _bert_emb_matrix = np.array(json.load(f))
-    if _sbert_model is None:
-        load_sbert_base64("sbert_model_b64.json")
+    _current_state()
+    _load_sbert()
+    if TFJS_MODEL_DIR:
+        _load_tfjs()
 
-def predict_session(features):
-    _load_all()
-    # RandomForest
-    X = np.array([example_to_vector(features, _vocab)])
-    probs = _model.predict_proba(X)[0]
-    idx = int(np.argmax(probs))
-    label = _labels[idx]
-    score = float(probs[idx])
-
-    # SBERT
-    sbert_vec = _sbert_model.encode([flatten_features(features)])[0]
-    sims_bert = cosine_similarity([sbert_vec], _bert_emb_matrix)[0]
-    idx_bert = int(np.argmax(sims_bert))
-    sim_label = _labels[idx_bert]
-    sim_score = float(sims_bert[idx_bert])
-
-    # TF-IDF Fallback
-    tfidf_test = _tfidf_model.transform([flatten_features(features)])
-    tfidf_examples = _tfidf_model.transform(_all_texts)
-    sims = cosine_similarity(tfidf_test, tfidf_examples)[0]
-    idx_tfidf = int(np.argmax(sims))
-    label_tfidf = _labels[idx_tfidf]
-    sim_score_tfidf = float(sims[idx_tfidf])
-
-    # Decision logic: prioriza confiança alta do RF, senão SBERT, senão TFIDF
-    if score >= 0.6:
-        return label, score
-    elif sim_score >= 0.60:
-        return sim_label, sim_score
+def _load_tfjs():
+    # Como o encoder SBERT: não vem do treino, carregado uma vez por worker
+    global _tfjs_model
+    if _tfjs_model is None:
+        with _state_lock:
+            if _tfjs_model is None:
+                from tfjs_model import TfjsClassifier
+                t0 = time.perf_counter()
+                _tfjs_model = TfjsClassifier(TFJS_MODEL_DIR)
+                metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, "tfjs")
+    return _tfjs_model
+
+def _stage_tfjs(state, features_list, texts):
+    # MLP do navegador como primeira etapa barata; rótulos que o modelo atual não conhece
+    # (o TF.js não é retreinado junto) passam adiante com score 0
+    labels, scores = _load_tfjs().predict(features_list)
+    known = set(state.labels)
+    return labels, np.array([s if label in known else 0.0 for label, s in zip(labels, scores)])
+
+def _stage_rf(state, features_list, texts):
+    if state.forest is not None:
+        probs = state.forest.predict_proba_indices([state.featurizer.token_indices(f) for f in features_list])
     else:
-        return label_tfidf, sim_score_tfidf
+        probs = state.model.predict_proba(state.featurizer.transform(features_list))
+    idx = np.argmax(probs, axis=1)
+    return [state.labels[i] for i in idx], probs[np.arange(len(idx)), idx]
+
+def _stage_sbert(state, features_list, texts):
+    sbert_vecs = _load_sbert().encode(texts, normalize_embeddings=True).astype(np.float32, copy=False)
+    ids, sims = state.sbert_index.search(sbert_vecs, k=SBERT_KNN)
+    return _knn_vote(state, ids, sims)
+
+def _knn_vote(state, ids, sims):
+    # Votação ponderada pela similaridade e pelo peso do exemplo; o score é o do vizinho mais próximo do rótulo vencedor
+    labels, scores = [], []
+    for row_ids, row_sims in zip(ids, sims):
+        votes, best = {}, {}
+        for i, s in zip(row_ids, row_sims):
+            if not np.isfinite(s):
+                continue
+            label = state.example_labels[i]
+            votes[label] = votes.get(label, 0.0) + float(s) * state.example_weights[i]
+            best[label] = max(best.get(label, -1.0), float(s))
+        if not votes:
+            # Nenhum vizinho válido (ex.: listas IVF sondadas vazias): score -inf, a linha segue para o TF-IDF
+            labels.append(None)
+            scores.append(-np.inf)
+            continue
+        label = max(votes, key=votes.get)
+        labels.append(label)
+        scores.append(best[label])
+    return labels, np.array(scores)
+
+def _stage_tfidf(state, features_list, texts):
+    # Linhas L2-normalizadas: cosseno = produto escalar esparso
+    tfidf_model, tfidf_matrix = state.tfidf
+    sims = (tfidf_model.transform(texts) @ tfidf_matrix.T).toarray()
+    idx = np.argmax(sims, axis=1)
+    return [state.example_labels[i] for i in idx], sims[np.arange(len(idx)), idx]
+
+# Cascata: (nome, função, limiar). Cada etapa só roda para os elementos que a anterior
+# não resolveu com score >= limiar; a última etapa responde o que sobrar.
+STAGES = [
+    ("rf", _stage_rf, float(os.getenv("RF_THRESHOLD", "0.6"))),
+    ("sbert", _stage_sbert, float(os.getenv("SBERT_THRESHOLD", "0.6"))),
+    ("tfidf", _stage_tfidf, None),
+]
+if TFJS_MODEL_DIR:
+    STAGES.insert(0, ("tfjs", _stage_tfjs, float(os.getenv("TFJS_THRESHOLD", "0.9"))))
+
+# Classifica uma lista de elementos de uma vez: uma matriz de features para o RF,
+# um único encode SBERT e um produto matriz-matriz por etapa de similaridade.
+# Retorna [{"sessao", "score", "stage", "timings"}, ...] na mesma ordem da entrada;
+# timings traz os ms de cada etapa pela qual o elemento passou (tempo do lote).
+# Elementos já vistos com o mesmo modelo saem do cache (stage original, "cached": True).
+def predict_sessions(features_list):
+    state = _current_state()
+    results = [None] * len(features_list)
+    # Com a etapa TF.js ligada, os tokens dela também definem a entrada (y em outro bucket)
+    keys = [feature_key(f, tfjs_tokens(f) if TFJS_MODEL_DIR else None) for f in features_list]
+    pending = []
+    for i, key in enumerate(keys):
+        cached = _prediction_cache.get(key)
+        if cached is not None:
+            results[i] = dict(cached, timings={}, cached=True)
+            metrics.PREDICT_ANSWERED.inc("cache")
+        else:
+            pending.append(i)
+    misses = list(pending)
+    texts = {i: flatten_features(features_list[i]) for i in pending}
+    timings = {}
+    for name, stage, threshold in STAGES:
+        if not pending:
+            break
+        t0 = time.perf_counter()
+        labels, scores = stage(state, [features_list[i] for i in pending], [texts[i] for i in pending])
+        elapsed = time.perf_counter() - t0
+        metrics.PREDICT_STAGE_SECONDS.observe(elapsed, name)
+        timings = dict(timings, **{name: round(elapsed * 1000, 3)})
+        still_pending = []
+        for i, label, score in zip(pending, labels, scores):
+            if threshold is None or score >= threshold:
+                results[i] = {"sessao": label, "score": float(score), "stage": name, "timings": timings}
+            else:
+                still_pending.append(i)
+        metrics.PREDICT_ANSWERED.inc(name, amount=len(pending) - len(still_pending))
+        pending = still_pending
+    # Chaves repetidas no mesmo lote: guarda uma vez só
+    new_items = {keys[i]: {"sessao": results[i]["sessao"], "score": results[i]["score"], "stage": results[i]["stage"]}
+                 for i in misses}
+    _prediction_cache.put_many(list(new_items.items()), version=state.version)
+    return results
+
+def prediction_cache_stats():
+    return _prediction_cache.stats()
+
+def predict_session(features):
+    result = predict_sessions([features])[0]
+    return result["sessao"], result["score"]
 
 # Teste manual:
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import os
+import zlib
+import numpy as np
+
+from featurizer import extract_tokens
+
+# Colapso de quase-duplicados antes do treino (mesmo botão com outro bucket de y, outro
+# siblingIndex etc.). Assinaturas MinHash sobre o conjunto de tokens do extract_tokens e
+# LSH por bandas para achar candidatos sem comparar todos os pares; cada candidato é
+# confirmado pelo Jaccard exato e só se junta a exemplos do mesmo rótulo.
+# Cada grupo vira um representante (o primeiro exemplo) com peso = tamanho do grupo.
+
+# Jaccard mínimo entre os tokens para colapsar (0 desliga)
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.95"))
+NEAR_DUP_PERMUTATIONS = int(os.getenv("NEAR_DUP_PERMUTATIONS", "64"))
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+def minhash_signatures(token_sets, num_perm=NEAR_DUP_PERMUTATIONS, seed=42, block=1024):
+    # (n, num_perm) uint32; h_i(x) = (a_i * x + b_i) mod p, truncado em 32 bits
+    vocab = {}
+    indices, indptr = [], [0]
+    for tokens in token_sets:
+        indices.extend(vocab.setdefault(t, len(vocab)) for t in tokens)
+        indptr.append(len(indices))
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    base = np.array([zlib.crc32(t.encode("utf-8")) for t in vocab], dtype=np.uint64)
+    # a, x < 2^32: o produto cabe em 64 bits; o resto por um primo de Mersenne espalha bem
+    hashed = ((np.outer(base, a) + b) % np.uint64(_PRIME)) & np.uint64(_MAX_HASH)  # (n_tokens, num_perm)
+    sig = np.full((len(token_sets), num_perm), _MAX_HASH, dtype=np.uint32)
+    indices = np.array(indices, dtype=np.int64)
+    indptr = np.array(indptr)
+    # Em blocos de exemplos: hashed[indices] inteiro teria n_tokens_total x num_perm
+    for start in range(0, len(token_sets), block):
+        rows = start + np.flatnonzero(np.diff(indptr[start:start + block + 1]) > 0)
+        if len(rows):
+            lo = indptr[rows[0]]
+            per_token = hashed[indices[lo:indptr[rows[-1] + 1]]]
+            sig[rows] = np.minimum.reduceat(per_token, indptr[rows] - lo, axis=0).astype(np.uint32)
+    return sig
+
+def lsh_params(threshold, num_perm):
+    # Bandas de r linhas com limiar aproximado (1/b)^(1/r) um pouco abaixo do pedido:
+    # prioriza não perder pares, os falsos candidatos são descartados pelo Jaccard exato
+    best = (num_perm, 1)
+    for r in range(1, num_perm + 1):
+        if num_perm % r == 0 and (1.0 / (num_perm // r)) ** (1.0 / r) <= threshold - 0.1:
+            best = (num_perm // r, r)
+    return best
+
+def _band_keys(signatures, threshold):
+    # Uma chave por (banda, exemplo): exemplos com a mesma chave em alguma banda são candidatos
+    bands, rows = lsh_params(threshold, signatures.shape[1])
+    return [list(map(bytes, np.ascontiguousarray(signatures[:, b * rows:(b + 1) * rows]))) for b in range(bands)]
+
+def collapse_near_duplicates(examples, labels, threshold=NEAR_DUP_THRESHOLD):
+    # Retorna (índices dos representantes, pesos, relatório)
+    n = len(examples)
+    if threshold <= 0 or n < 2:
+        return list(range(n)), [1] * n, {"examples": n, "representatives": n, "collapsed": 0, "threshold": threshold}
+    token_sets = [frozenset(extract_tokens(ex)) for ex in examples]
+    sig = minhash_signatures(token_sets)
+    band_keys = _band_keys(sig, threshold)
+    buckets = {}
+    for band, keys in enumerate(band_keys):
+        for i, key in enumerate(keys):
+            buckets.setdefault((band, key), []).append(i)
+    buckets = {k: np.array(v) for k, v in buckets.items() if len(v) > 1}
+    label_ids = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)[1]
+    # Líder: o primeiro exemplo ainda livre absorve os candidatos livres do mesmo rótulo com
+    # Jaccard >= threshold; todo membro fica perto do seu representante (sem encadear A~B~C).
+    # Os candidatos passam antes pela estimativa MinHash (vetorizada) e só os prováveis vão
+    # para o Jaccard exato; absorvidos saem dos buckets.
+    leader_of = np.full(n, -1, dtype=np.int64)
+    reps, weights = [], []
+    for i in range(n):
+        if leader_of[i] >= 0:
+            continue
+        leader_of[i] = i
+        size = 1
+        found = []
+        for band, keys in enumerate(band_keys):
+            key = (band, keys[i])
+            members = buckets.get(key)
+            if members is None:
+                continue
+            members = members[leader_of[members] < 0]
+            buckets[key] = members
+            found.append(members)
+        if found:
+            cand = np.unique(np.concatenate(found))
+            cand = cand[label_ids[cand] == label_ids[i]]
+            # Filtro grosso com 32 permutações, depois a estimativa completa
+            cand = cand[(sig[cand, :32] == sig[i, :32]).mean(axis=1) >= threshold - 0.2]
+            cand = cand[(sig[cand] == sig[i]).mean(axis=1) >= threshold - 0.1]
+            for j in cand:
+                union = len(token_sets[i] | token_sets[j])
+                if union and len(token_sets[i] & token_sets[j]) / union >= threshold:
+                    leader_of[j] = i
+                    size += 1
+        reps.append(i)
+        weights.append(size)
+    report = {
+        "examples": n,
+        "representatives": len(reps),
+        "collapsed": n - len(reps),
+        "shrink": round(1 - len(reps) / n, 4),
+        "largest_group": max(weights),
+        "threshold": threshold,
+    }
+    return reps, weights, report
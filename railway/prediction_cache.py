@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from featurizer import extract_tokens, flatten_features
+
+# Cache LRU de predições. A chave é o que o pipeline de fato enxerga: o conjunto de tokens
+# do RF (numéricos já em buckets) mais o texto achatado do SBERT/TF-IDF. Assim o mesmo
+# header/menu/banner em outra posição de página (y, siblingIndex no mesmo bucket) é um hit.
+# Etapas com entrada própria (o TF.js arredonda o y de outro jeito) entram com extra_tokens.
+# O cache é limpo quando a versão do modelo carregado muda.
+
+PREDICTION_CACHE_ENTRIES = int(os.getenv("PREDICTION_CACHE_ENTRIES", "10000"))
+PREDICTION_CACHE_BYTES = int(os.getenv("PREDICTION_CACHE_BYTES", str(16 * 1024 * 1024)))
+# Caminho de um SQLite compartilhado entre os workers do gunicorn (vazio = só memória local)
+PREDICTION_CACHE_SHARED = os.getenv("PREDICTION_CACHE_SHARED", "")
+
+def feature_key(features, extra_tokens=None):
+    tokens = "\x1f".join(sorted(set(extract_tokens(features))))
+    if extra_tokens is not None:
+        tokens += "\x1d" + "\x1f".join(sorted(set(extra_tokens)))
+    return hashlib.sha1((tokens + "\x1e" + flatten_features(features)).encode("utf-8")).hexdigest()
+
+class SQLiteBackend:
+    # Segundo nível compartilhado: um arquivo SQLite em WAL, uma conexão por thread.
+    # LRU pelo campo used: hits ficam em _touched e vão para o banco em lote (no próximo
+    # put_many ou a cada TOUCH_BATCH hits), sem uma escrita por leitura.
+    TOUCH_BATCH = 64
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        self._touched = {}  # key -> último uso
+        self._touch_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, version TEXT, value TEXT, used REAL)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, version):
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM cache WHERE key = ? AND version = ?", (key, version)).fetchone()
+        if row is None:
+            return None
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            flush = len(self._touched) >= self.TOUCH_BATCH
+        if flush:
+            self._flush_touched(conn)
+            conn.commit()
+        return json.loads(row[0])
+
+    def _flush_touched(self, conn):
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany("UPDATE cache SET used = MAX(used, ?) WHERE key = ?", [(t, k) for k, t in touched.items()])
+
+    def put_many(self, items, version):
+        conn = self._conn()
+        now = time.time()
+        self._flush_touched(conn)
+        conn.executemany("INSERT OR REPLACE INTO cache (key, version, value, used) VALUES (?, ?, ?, ?)",
+                         [(k, version, json.dumps(v, ensure_ascii=False), now) for k, v in items])
+        self._puts += len(items)
+        if self._puts >= max(self.max_entries // 10, 1):
+            # Poda ocasional: versões antigas e o excedente usado há mais tempo
+            self._puts = 0
+            conn.execute("DELETE FROM cache WHERE version != ?", (version,))
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                         (self.max_entries,))
+        conn.commit()
+
+class PredictionCache:
+    def __init__(self, max_entries=PREDICTION_CACHE_ENTRIES, max_bytes=PREDICTION_CACHE_BYTES,
+                 shared_path=PREDICTION_CACHE_SHARED):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.version = None
+        self.shared = SQLiteBackend(shared_path, max_entries) if shared_path else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self._bytes = 0
+                self.version = version
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key, self.version)
+            except sqlite3.Error as e:
+                print("[Auto-UX] Cache compartilhado indisponível:", e)
+                value = None
+            if value is not None:
+                self._put_local(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_local(self, key, value):
+        size = len(key) + len(json.dumps(value, ensure_ascii=False))
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def put_many(self, items, version=None):
+        # version: do modelo que calculou os itens; se ele já foi trocado, não guarda nada
+        if version is not None and version != self.version:
+            return
+        for key, value in items:
+            self._put_local(key, value)
+        if self.shared is not None and items:
+            try:
+                self.shared.put_many(items, self.version)
+            except sqlite3.Error as e:
+                print("[Auto-UX] Cache compartilhado indisponível:", e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "version": self.version,
+                "shared": bool(self.shared),
+            }
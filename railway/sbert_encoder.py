@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from torch import nn
+from safetensors.torch import load_file
+from tokenizers import Tokenizer
+
+# Encoder SBERT enxuto para CPU, para o passo de predição.
+# Lê direto o diretório salvo pelo SentenceTransformer (config.json, model.safetensors,
+# tokenizer.json, 1_Pooling), sem importar transformers/sentence_transformers:
+#   - pesos por mmap do safetensors, montados sem inicialização (device meta + assign)
+#   - quantização dinâmica int8 das camadas Linear (SBERT_QUANTIZE=0 desliga)
+#   - torch com SBERT_THREADS threads por worker
+#   - cache LRU da tokenização por texto
+# Mesmo resultado do SentenceTransformer (BERT + mean pooling) a menos da quantização.
+
+SBERT_MODEL_DIR = os.getenv("SBERT_MODEL_DIR", "sbert_model")
+# Modelo base (o mesmo do treino, train_ux.SBERT_MODEL_NAME) para criar o diretório quando falta
+SBERT_MODEL_NAME = os.getenv("SBERT_MODEL_NAME", "all-MiniLM-L6-v2")
+SBERT_QUANTIZE = os.getenv("SBERT_QUANTIZE", "1") == "1"
+SBERT_THREADS = int(os.getenv("SBERT_THREADS", "1"))
+SBERT_TOKEN_CACHE = int(os.getenv("SBERT_TOKEN_CACHE", "20000"))
+
+def _embedding(n, dim):
+    # Sem a inicialização normal_ do nn.Embedding (no device meta ela importa o torch._dynamo, ~4s)
+    return nn.Embedding(n, dim, _weight=torch.empty(n, dim))
+
+class _Embeddings(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.word_embeddings = _embedding(cfg["vocab_size"], cfg["hidden_size"])
+        self.position_embeddings = _embedding(cfg["max_position_embeddings"], cfg["hidden_size"])
+        self.token_type_embeddings = _embedding(cfg["type_vocab_size"], cfg["hidden_size"])
+        self.LayerNorm = nn.LayerNorm(cfg["hidden_size"], eps=cfg["layer_norm_eps"])
+
+    def forward(self, input_ids):
+        positions = torch.arange(input_ids.shape[1], device=input_ids.device)
+        h = self.word_embeddings(input_ids) + self.position_embeddings(positions)[None] + self.token_type_embeddings.weight[0]
+        return self.LayerNorm(h)
+
+class _SelfAttention(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.query = nn.Linear(cfg["hidden_size"], cfg["hidden_size"])
+        self.key = nn.Linear(cfg["hidden_size"], cfg["hidden_size"])
+        self.value = nn.Linear(cfg["hidden_size"], cfg["hidden_size"])
+
+class _DenseNorm(nn.Module):
+    def __init__(self, n_in, n_out, eps):
+        super().__init__()
+        self.dense = nn.Linear(n_in, n_out)
+        self.LayerNorm = nn.LayerNorm(n_out, eps=eps)
+
+class _Attention(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.self = _SelfAttention(cfg)
+        self.output = _DenseNorm(cfg["hidden_size"], cfg["hidden_size"], cfg["layer_norm_eps"])
+
+class _Intermediate(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.dense = nn.Linear(cfg["hidden_size"], cfg["intermediate_size"])
+
+class _Layer(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.n_heads = cfg["num_attention_heads"]
+        self.attention = _Attention(cfg)
+        self.intermediate = _Intermediate(cfg)
+        self.output = _DenseNorm(cfg["intermediate_size"], cfg["hidden_size"], cfg["layer_norm_eps"])
+
+    def forward(self, h, attn_bias):
+        b, l, d = h.shape
+        att = self.attention.self
+        split = lambda x: x.view(b, l, self.n_heads, d // self.n_heads).transpose(1, 2)
+        ctx = nn.functional.scaled_dot_product_attention(split(att.query(h)), split(att.key(h)), split(att.value(h)),
+                                                         attn_mask=attn_bias)
+        ctx = ctx.transpose(1, 2).reshape(b, l, d)
+        h = self.attention.output.LayerNorm(self.attention.output.dense(ctx) + h)
+        inter = nn.functional.gelu(self.intermediate.dense(h))
+        return self.output.LayerNorm(self.output.dense(inter) + h)
+
+class _Encoder(nn.Module):
+    def __init__(self, cfg):
+        super().__init__()
+        self.layer = nn.ModuleList([_Layer(cfg) for _ in range(cfg["num_hidden_layers"])])
+
+class _Bert(nn.Module):
+    # Mesmos nomes de parâmetros do BertModel, para carregar o safetensors sem conversão
+    def __init__(self, cfg):
+        super().__init__()
+        self.embeddings = _Embeddings(cfg)
+        self.encoder = _Encoder(cfg)
+
+    def forward(self, input_ids, attention_mask):
+        h = self.embeddings(input_ids)
+        # Máscara aditiva (0 ou -inf nas posições de padding)
+        attn_bias = torch.zeros(attention_mask.shape, dtype=h.dtype).masked_fill(attention_mask == 0, float("-inf"))
+        attn_bias = attn_bias[:, None, None, :]
+        for layer in self.encoder.layer:
+            h = layer(h, attn_bias)
+        return h
+
+def ensure_model_dir(model_dir=SBERT_MODEL_DIR, model_name=SBERT_MODEL_NAME, model=None):
+    # O encoder não vai no pacote do modelo (não muda entre treinos e tem ~90 MB): treino e
+    # workers sem o diretório salvam o mesmo modelo base nele. Salva num temporário e renomeia,
+    # então workers subindo juntos não deixam um diretório pela metade.
+    if os.path.exists(os.path.join(model_dir, "model.safetensors")):
+        return model_dir
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device="cpu")
+    tmp = f"{model_dir}.tmp-{os.getpid()}"
+    model.save(tmp)
+    try:
+        os.rename(tmp, model_dir)
+        print(f"[Auto-UX] Modelo SBERT {model_name} salvo em {model_dir}/")
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # outro processo salvou antes
+    return model_dir
+
+class SbertEncoder:
+    def __init__(self, model_dir=SBERT_MODEL_DIR, quantize=SBERT_QUANTIZE, threads=SBERT_THREADS,
+                 token_cache=SBERT_TOKEN_CACHE):
+        if threads:
+            torch.set_num_threads(threads)
+        with open(os.path.join(model_dir, "config.json"), "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        if cfg.get("model_type") != "bert" or cfg.get("hidden_act", "gelu") != "gelu" \
+                or cfg.get("position_embedding_type", "absolute") != "absolute":
+            raise ValueError(f"Arquitetura não suportada pelo encoder enxuto: {cfg.get('model_type')}")
+        self.pooling = "mean"
+        pooling_cfg = os.path.join(model_dir, "1_Pooling", "config.json")
+        if os.path.exists(pooling_cfg):
+            with open(pooling_cfg, "r", encoding="utf-8") as f:
+                pooling = json.load(f)
+            self.pooling = pooling.get("pooling_mode") or ("cls" if pooling.get("pooling_mode_cls_token") else "mean")
+        if self.pooling not in ("mean", "cls"):
+            raise ValueError(f"Pooling não suportado: {self.pooling}")
+        # Comprimento máximo: sentence_bert_config.json (versões antigas do ST) ou tokenizer_config.json
+        max_len = None
+        for name, key in (("sentence_bert_config.json", "max_seq_length"), ("tokenizer_config.json", "model_max_length")):
+            path = os.path.join(model_dir, name)
+            if max_len is None and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    max_len = json.load(f).get(key)
+        max_len = min(max_len or cfg["max_position_embeddings"], cfg["max_position_embeddings"])
+
+        with torch.device("meta"):
+            model = _Bert(cfg)
+        state = load_file(os.path.join(model_dir, "model.safetensors"))
+        state = {k[len("bert."):] if k.startswith("bert.") else k: v for k, v in state.items()}
+        missing, _ = model.load_state_dict(state, strict=False, assign=True)
+        if missing:
+            raise ValueError(f"Pesos ausentes no modelo SBERT: {missing[:5]}")
+        model.eval()
+        if quantize:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # aviso de depreciação dos tensores quantizados
+                model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.model = model
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_len)
+        self.pad_id = cfg.get("pad_token_id") or 0
+        self._token_cache = OrderedDict()
+        self._token_cache_size = token_cache
+        self._lock = threading.Lock()
+
+    def _token_ids(self, texts):
+        ids = [None] * len(texts)
+        todo = []
+        with self._lock:
+            for i, t in enumerate(texts):
+                cached = self._token_cache.get(t)
+                if cached is not None:
+                    self._token_cache.move_to_end(t)
+                    ids[i] = cached
+                else:
+                    todo.append(i)
+        if todo:
+            encoded = self.tokenizer.encode_batch([texts[i].strip() for i in todo])
+            with self._lock:
+                for i, enc in zip(todo, encoded):
+                    ids[i] = enc.ids
+                    self._token_cache[texts[i]] = enc.ids
+                while len(self._token_cache) > self._token_cache_size:
+                    self._token_cache.popitem(last=False)
+        return ids
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        ids = self._token_ids(list(texts))
+        out = np.zeros((len(ids), self.model.embeddings.word_embeddings.embedding_dim), dtype=np.float32)
+        # Lotes por comprimento parecido: menos padding
+        order = sorted(range(len(ids)), key=lambda i: len(ids[i]))
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                chunk = order[start:start + batch_size]
+                max_len = max(len(ids[i]) for i in chunk)
+                input_ids = torch.full((len(chunk), max_len), self.pad_id, dtype=torch.long)
+                mask = torch.zeros((len(chunk), max_len), dtype=torch.long)
+                for row, i in enumerate(chunk):
+                    input_ids[row, :len(ids[i])] = torch.tensor(ids[i])
+                    mask[row, :len(ids[i])] = 1
+                h = self.model(input_ids, mask)
+                if self.pooling == "cls":
+                    emb = h[:, 0]
+                else:
+                    m = mask[..., None].to(h.dtype)
+                    emb = (h * m).sum(1) / m.sum(1).clamp(min=1e-9)
+                out[chunk] = emb.numpy()
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import model_predict
+from vector_index import IVFIndex
+
+# Uso: python -m pytest test_knn_vote.py
+
+def _index_with_empty_list():
+    matrix = np.eye(4, dtype=np.float32)
+    centroids = np.eye(4, dtype=np.float32)[:2]
+    # Lista 0 vazia; as 4 linhas estão todas na lista 1
+    return IVFIndex(matrix, centroids, order=np.arange(4), offsets=np.array([0, 0, 4]), nprobe=1)
+
+def test_empty_probe_falls_through():
+    state = SimpleNamespace(example_labels=["Menu", "Rodapé", "Busca", "Menu"], example_weights=[1, 1, 1, 1])
+    queries = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float32)
+    ids, sims = _index_with_empty_list().search(queries, k=2)
+    assert not np.isfinite(sims[0]).any()
+    labels, scores = model_predict._knn_vote(state, ids, sims)
+    # Sem vizinhos: score -inf (abaixo de qualquer limiar), a cascata passa a linha adiante
+    assert labels[0] is None and scores[0] == -np.inf
+    assert labels[1] == "Rodapé" and scores[1] == 1.0
@@ -0,0 +1,27 @@
+from featurizer import extract_tokens
+from prediction_cache import PredictionCache, feature_key
+from tfjs_model import tfjs_tokens
+
+# Uso: python -m pytest test_prediction_cache.py
+
+def _payloads():
+    base = {"tag": "A", "class": "menu principal", "text": "Início", "siblingIndex": 0,
+            "parents": [{"tag": "NAV", "class": "nav", "text": "Menu principal"}]}
+    # y=14 e y=16: mesmo bucket do RF (y10), buckets diferentes no TF.js (y10 / y20)
+    return dict(base, y=14), dict(base, y=16)
+
+def test_tfjs_inputs_split_the_key():
+    a, b = _payloads()
+    assert extract_tokens(a) == extract_tokens(b)
+    assert tfjs_tokens(a) != tfjs_tokens(b)
+    # Sem a etapa TF.js a chave é a mesma (mesma entrada para RF/SBERT/TF-IDF)
+    assert feature_key(a) == feature_key(b)
+    assert feature_key(a, tfjs_tokens(a)) != feature_key(b, tfjs_tokens(b))
+
+def test_tfjs_inputs_do_not_share_an_entry():
+    a, b = _payloads()
+    cache = PredictionCache(max_entries=10, shared_path="")
+    cache.set_version("v1")
+    cache.put_many([(feature_key(a, tfjs_tokens(a)), {"sessao": "Menu", "score": 0.95, "stage": "tfjs"})], version="v1")
+    assert cache.get(feature_key(a, tfjs_tokens(a)))["sessao"] == "Menu"
+    assert cache.get(feature_key(b, tfjs_tokens(b))) is None
@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import re
+import numpy as np
+from scipy import sparse
+
+# Classificador TF.js (model.json + model.weights.bin, Sequential de Dense) rodando em NumPy:
+#   - pesos lidos por mmap do .bin (np.memmap + fatias, sem cópia quando são float32)
+#   - primeira camada como produto CSR x denso (entrada binária esparsa): custo proporcional
+#     aos tokens do elemento, não ao vocabulário
+#   - TFJS_DTYPE=float16 guarda os kernels em float16 (metade da memória), calculando em float32
+# A entrada é a do treino feito no navegador: vocabulário allWords.json ao lado do model.json,
+# tokens pela tokenização do JS (tfjs_tokens), vetor binário.
+
+TFJS_MODEL_DIR = os.getenv("TFJS_MODEL_DIR", "")
+TFJS_DTYPE = os.getenv("TFJS_DTYPE", "float32")
+
+# Palavras do JS: trechos de \w (só ASCII) com 2+ caracteres, "conheça" -> "conhe"
+_WORD = re.compile(r"[a-z0-9_]{2,}")
+
+# Mesmo byte-size/tipo dos dtypes do weightsManifest
+_DTYPES = {"float32": "<f4", "int32": "<i4", "bool": "u1", "uint8": "u1", "uint16": "<u2", "float16": "<f2"}
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+_ACTIVATIONS["softmax"] = _softmax
+
+def tfjs_tokens(features):
+    # Reproduz o vocabulário do model.json: minúsculas, quebra em não-[a-z0-9_], tokens com 2+
+    # caracteres; y arredondado para dezenas (Math.round) e siblingIndex limitado a 10.
+    # Um findall só sobre os campos juntos (os textos dos pais podem ser a página inteira).
+    parts = [features.get(k, "") for k in ['class', 'text', 'id', 'tag', 'selector']]
+    for p in features.get('parents') or []:
+        parts.extend(p.get(k, "") for k in ['class', 'text', 'id', 'tag', 'selector'])
+    parts.extend(features.get('contextHeadings') or [])
+    tokens = _WORD.findall(" ".join(v for v in parts if isinstance(v, str)).lower())
+    if isinstance(features.get('y'), (int, float)):
+        tokens.append(f"y{int(math.floor(features['y'] / 10 + 0.5)) * 10}")
+    if isinstance(features.get('siblingIndex'), (int, float)):
+        tokens.append(f"sib{min(int(features['siblingIndex']), 10)}")
+    return tokens
+
+def load_weights(model_dir, manifest):
+    # {nome: array} a partir do weightsManifest; cada grupo é a concatenação dos seus shards
+    weights = {}
+    for group in manifest:
+        shards = [np.memmap(os.path.join(model_dir, p), dtype=np.uint8, mode="r") for p in group["paths"]]
+        buf = shards[0] if len(shards) == 1 else np.concatenate(shards)
+        offset = 0
+        for spec in group["weights"]:
+            quant = spec.get("quantization")
+            dtype = np.dtype(_DTYPES[quant["dtype"] if quant else spec["dtype"]])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            arr = buf[offset:offset + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+            offset += count * dtype.itemsize
+            if quant and quant["dtype"] in ("uint8", "uint16"):
+                # Quantização afim do tfjs-converter: valor = q * scale + min
+                arr = arr.astype(np.float32) * np.float32(quant["scale"]) + np.float32(quant["min"])
+            weights[spec["name"]] = arr
+    return weights
+
+class TfjsClassifier:
+    def __init__(self, model_dir=TFJS_MODEL_DIR, dtype=TFJS_DTYPE, labels_file=None):
+        with open(os.path.join(model_dir, "model.json"), "r", encoding="utf-8") as f:
+            model = json.load(f)
+        weights = load_weights(model_dir, model["weightsManifest"])
+        topology = model["modelTopology"]
+        topology = topology.get("model_config", topology)
+        if topology["class_name"] != "Sequential":
+            raise ValueError(f"Modelo TF.js não suportado: {topology['class_name']}")
+        layers = topology["config"]["layers"] if isinstance(topology["config"], dict) else topology["config"]
+        self.layers = []  # (kernel, bias, ativação)
+        for layer in layers:
+            kind, cfg = layer["class_name"], layer["config"]
+            if kind == "Dropout":
+                continue  # sem efeito na inferência
+            if kind != "Dense":
+                raise ValueError(f"Camada TF.js não suportada: {kind}")
+            if cfg.get("activation", "linear") not in _ACTIVATIONS:
+                raise ValueError(f"Ativação não suportada: {cfg.get('activation')}")
+            kernel = weights[f"{cfg['name']}/kernel"]
+            # Bias e kernels pequenos em float32; o kernel grande segue o dtype pedido
+            kernel = kernel if kernel.dtype == np.dtype(dtype) else kernel.astype(dtype)
+            bias = weights[f"{cfg['name']}/bias"].astype(np.float32) if cfg.get("use_bias", True) else None
+            self.layers.append((kernel, bias, _ACTIVATIONS[cfg.get("activation", "linear")]))
+
+        with open(os.path.join(model_dir, "allWords.json"), "r", encoding="utf-8") as f:
+            self.index = {w: i for i, w in enumerate(json.load(f))}
+        if len(self.index) != self.layers[0][0].shape[0]:
+            raise ValueError(f"allWords.json tem {len(self.index)} tokens, o modelo espera {self.layers[0][0].shape[0]}")
+        # tfjs_labels.json: rótulos na ordem das saídas do modelo; labels.json como fallback
+        if labels_file is None:
+            labels_file = "tfjs_labels.json" if os.path.exists(os.path.join(model_dir, "tfjs_labels.json")) else "labels.json"
+        with open(os.path.join(model_dir, labels_file), "r", encoding="utf-8") as f:
+            self.labels = json.load(f)
+        if len(self.labels) != self.layers[-1][0].shape[1]:
+            raise ValueError(f"{labels_file} tem {len(self.labels)} rótulos, o modelo tem {self.layers[-1][0].shape[1]} saídas")
+
+    def token_indices(self, features):
+        index = self.index
+        return sorted({index[t] for t in set(tfjs_tokens(features)) if t in index})
+
+    def predict_proba(self, features_list):
+        indptr = [0]
+        indices = []
+        for f in features_list:
+            indices.extend(self.token_indices(f))
+            indptr.append(len(indices))
+        X = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int32),
+                               np.array(indptr, dtype=np.int64)), shape=(len(features_list), len(self.index)))
+        h = None
+        for kernel, bias, activation in self.layers:
+            h = (X @ kernel if h is None else h @ kernel).astype(np.float32, copy=False)
+            if bias is not None:
+                h += bias
+            h = activation(h)
+        return h
+
+    def predict(self, features_list):
+        probs = self.predict_proba(features_list)
+        idx = np.argmax(probs, axis=1)
+        return [self.labels[i] for i in idx], probs[np.arange(len(idx)), idx]
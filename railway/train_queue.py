@@ -0,0 +1,223 @@
+import fcntl
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+import metrics
+
+# Fila de treino em background para o /salvar_examples.
+# Cada worker do gunicorn tem uma thread que dispara o treino num processo separado
+# (spawn + nice), então o /predict continua com o GIL e a CPU livres enquanto o modelo treina.
+# Tudo fica em TRAIN_JOBS_DIR, compartilhado pelos workers da máquina:
+#   <id>.json    status de cada job, legível por qualquer worker
+#   pending      job ainda não iniciado; submissões de qualquer worker se juntam a ele
+#   queue.lock   flock das operações na fila (juntar/criar/pegar o pending)
+#   train.lock   flock segurado pelo processo de treino: um único treino por vez
+# Um job pendente sobrevive a reinícios (qualquer worker o pega). Um job cujo processo morreu
+# (reinício no meio do treino) aparece como erro no /train_status em vez de ficar
+# "queued"/"running" para sempre; os exemplos continuam no store e o próximo treino os inclui.
+
+TRAIN_JOBS_DIR = os.getenv("TRAIN_JOBS_DIR", "train_jobs")
+TRAIN_NICE = int(os.getenv("TRAIN_NICE", "10"))
+# De quantos em quantos segundos a thread de cada worker procura job pendente de outro worker
+TRAIN_QUEUE_POLL = float(os.getenv("TRAIN_QUEUE_POLL", "5"))
+
+_lock = threading.Condition()
+_thread = None
+
+def _status_path(job_id):
+    return os.path.join(TRAIN_JOBS_DIR, f"{job_id}.json")
+
+def _write_status(job_id, **fields):
+    os.makedirs(TRAIN_JOBS_DIR, exist_ok=True)
+    status = _read_status(job_id) or {}
+    status.update(fields)
+    tmp = _status_path(job_id) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(status, f, ensure_ascii=False)
+    os.replace(tmp, _status_path(job_id))
+    return status
+
+def _read_status(job_id):
+    try:
+        with open(_status_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _queue_lock():
+    os.makedirs(TRAIN_JOBS_DIR, exist_ok=True)
+    f = open(os.path.join(TRAIN_JOBS_DIR, "queue.lock"), "w")
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+def _pending_path():
+    return os.path.join(TRAIN_JOBS_DIR, "pending")
+
+def _read_pending():
+    try:
+        with open(_pending_path(), "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Zumbi (órfão não recolhido, comum em container sem init) também conta como morto
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()[0] != b"Z"
+    except (OSError, IndexError):
+        return True
+
+def get_status(job_id):
+    # job_id vem da URL: só aceita o formato gerado por submit_training
+    if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+        return None
+    status = _read_status(job_id)
+    if status and status.get("status") in ("queued", "running") and status.get("pid") \
+            and not _pid_alive(status["pid"]):
+        # Quem pegou o job morreu (reinício/deploy no meio do treino)
+        status = _write_status(job_id, status="error", msg="Treino interrompido (processo reiniciado)",
+                               finished_at=time.time())
+    if status and status.get("status") == "running":
+        status["duration"] = round(time.time() - status["started_at"], 1)
+    return status
+
+def submit_training(json_path):
+    lock_file = _queue_lock()
+    try:
+        pending = _read_pending()
+        if pending is not None:
+            status = _read_status(pending) or {}
+            if status.get("status") == "queued":
+                _write_status(pending, submissions=status.get("submissions", 1) + 1)
+                print(f"[Auto-UX] Treino já agendado, juntando ao job {pending}")
+                return pending
+        job_id = uuid.uuid4().hex
+        _write_status(job_id, id=job_id, status="queued", stage=None, progress=0.0,
+                      submissions=1, json_path=json_path, created_at=time.time())
+        with open(_pending_path() + ".tmp", "w") as f:
+            f.write(job_id)
+        os.replace(_pending_path() + ".tmp", _pending_path())
+    finally:
+        lock_file.close()
+    start_worker()
+    with _lock:
+        _lock.notify()
+    print(f"[Auto-UX] Treino agendado: job {job_id}")
+    return job_id
+
+def start_worker():
+    # Uma thread por worker; também chamada na subida do app para retomar jobs pendentes
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_worker_loop, name="train-queue", daemon=True)
+            _thread.start()
+
+def _claim():
+    # Pega o job pendente (se houver); a partir daqui novas submissões criam um job novo
+    if _read_pending() is None:
+        return None
+    lock_file = _queue_lock()
+    try:
+        job_id = _read_pending()
+        if job_id is None:
+            return None
+        os.remove(_pending_path())
+        if (_read_status(job_id) or {}).get("status") != "queued":
+            return None
+        _write_status(job_id, pid=os.getpid())
+        return job_id
+    finally:
+        lock_file.close()
+
+def _worker_loop():
+    while True:
+        try:
+            job_id = _claim()
+        except Exception as e:
+            print("[Auto-UX] ERRO na fila de treino:", e)
+            job_id = None
+        if job_id is None:
+            with _lock:
+                _lock.wait(TRAIN_QUEUE_POLL)
+            continue
+        try:
+            _run_job(job_id)
+        except Exception as e:
+            # Nem o status de erro pôde ser gravado: registra e segue com a fila
+            print("[Auto-UX] ERRO no job de treino", job_id, e)
+
+def _run_job(job_id):
+    try:
+        # Arquivo de status sumido/corrompido: o job vira erro em vez de derrubar o worker
+        json_path = (_read_status(job_id) or {}).get("json_path")
+        if not json_path:
+            raise ValueError(f"Status do job {job_id} sem json_path")
+        ctx = multiprocessing.get_context("spawn")
+        proc = ctx.Process(target=_train_process, args=(job_id, json_path), name=f"train-{job_id[:8]}")
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0 and (_read_status(job_id) or {}).get("status") != "error":
+            _write_status(job_id, status="error", msg=f"Processo de treino saiu com código {proc.exitcode}",
+                          finished_at=time.time())
+    except Exception as e:
+        print("[Auto-UX] ERRO ao iniciar treino:", e)
+        _write_status(job_id, status="error", msg=str(e), finished_at=time.time())
+    _observe_job(_read_status(job_id) or {})
+
+def _observe_job(status):
+    # O treino roda em outro processo: as métricas vêm do arquivo de status do job
+    metrics.TRAIN_JOBS.inc(status.get("status", "unknown"))
+    for stage, seconds in (status.get("stages") or {}).items():
+        metrics.TRAIN_STAGE_SECONDS.set(seconds, stage)
+    if status.get("duration") is not None:
+        metrics.TRAIN_DURATION_SECONDS.set(status["duration"])
+
+def _train_process(job_id, json_path):
+    if TRAIN_NICE:
+        os.nice(TRAIN_NICE)
+    # O processo de treino passa a ser o dono do job (segue vivo se o worker cair)
+    _write_status(job_id, pid=os.getpid())
+    # Um treino por vez na máquina; o flock é solto quando este processo termina
+    lock_file = open(os.path.join(TRAIN_JOBS_DIR, "train.lock"), "w")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    started = time.time()
+    stages = {}
+    current = {"stage": None, "t": started}
+
+    def progress(stage, fraction):
+        now = time.time()
+        if stage != current["stage"]:
+            if current["stage"] is not None:
+                stages[current["stage"]] = round(now - current["t"], 2)
+            current["stage"], current["t"] = stage, now
+        _write_status(job_id, stage=stage, progress=round(fraction, 3), stages=stages)
+
+    _write_status(job_id, status="running", stage="iniciando", started_at=started)
+    try:
+        from train_ux import train_and_save_model
+        summary = train_and_save_model(json_path, progress=progress) or {}
+    except Exception as e:
+        print("[Auto-UX] ERRO no treino em background:", e)
+        _write_status(job_id, status="error", msg=str(e), finished_at=time.time(),
+                      duration=round(time.time() - started, 1))
+        raise
+    finally:
+        # Chamadas ao GitHub feitas pelo treino (upload dos artefatos) entram no /metrics dos workers
+        metrics.flush()
+    now = time.time()
+    stages[current["stage"]] = round(now - current["t"], 2)
+    _write_status(job_id, status="done", stage=None, progress=1.0, stages=stages,
+                  finished_at=now, duration=round(now - started, 1), **summary)
+    print(f"[Auto-UX] Job {job_id} concluído em {now - started:.1f}s.")
@@ -5,148 +5,215 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 import joblib
+from scipy import sparse
 from sentence_transformers import SentenceTransformer
-import tempfile, shutil, tarfile, io, base64
-
-from git_utils import save_file_to_github, get_file_from_github
-
-def flatten_features(example):
-    text_parts = [
-        example.get('text',''),
-        example.get('tag',''),
-        example.get('id',''),
-        example.get('class',''),
-        example.get('selector',''),
-        str(example.get('contextHeadings',[])),
-    ]
-    for p in example.get('parents',[]):
-        text_parts.append(p.get('text',''))
-        text_parts.append(p.get('selector',''))
-    return " | ".join([str(x) for x in text_parts if x])
-
-def extract_tokens(features):
-    tokens = []
-    for k in ['class', 'text', 'id', 'tag', 'selector', 'role', 'type', 'placeholder', 'href', 'title', 'alt']:
-        val = features.get(k, "")
-        if isinstance(val, str):
-            tokens += [w.lower() for w in val.split() if len(w) > 1]
-    if 'parents' in features:
-        for p in features['parents']:
-            for k in ['class', 'text', 'id', 'tag', 'selector']:
-                val = p.get(k, "")
-                if isinstance(val, str):
-                    tokens += [w.lower() for w in val.split() if len(w) > 1]
-    if 'contextHeadings' in features and features['contextHeadings']:
-        for h in features['contextHeadings']:
-            tokens += [w.lower() for w in h.split() if len(w) > 1]
-    if 'y' in features: tokens.append(f'y{int(features['y']//10)*10}')
-    if 'siblingIndex' in features: tokens.append(f'sib{min(int(features['siblingIndex']), 10)}')
-    if 'width' in features: tokens.append(f'w{int(features['width']//50)*50}')
-    if 'height' in features: tokens.append(f'h{int(features['height']//20)*20}')
-    if 'depth' in features: tokens.append(f'd{min(int(features['depth']), 10)}')
-    if 'clickable' in features: tokens.append(f'click{features['clickable']}')
-    return tokens
-
-def build_vocab(examples):
-    vocab = set()
-    for ex in examples:
-        tokens = extract_tokens(ex)
-        vocab.update(tokens)
-    return sorted(vocab)
-
-def example_to_vector(example, vocab):
-    tokens = set(extract_tokens(example))
-    return [1 if w in tokens else 0 for w in vocab]
-
-def upload_artifacts_to_github(artifacts):
-    for fname, (filedata, is_binary) in artifacts.items():
-        # NUNCA subir o sbert_model_b64.json (muito grande, usado só local)
-        if fname == "sbert_model_b64.json":
-            print(f"[Auto-UX] Pulando upload de {fname} (muito grande, só local)")
-            continue
-        if is_binary and isinstance(filedata, bytes) and len(filedata) > 90*1024*1024:
+import hashlib
+
+from git_utils import commit_files_to_github
+from featurizer import flatten_features, build_vocab, Featurizer
+from vector_index import build_index
+from near_dedup import collapse_near_duplicates
+from model_bundle import BUNDLE_FILE, write_bundle
+from compiled_forest import CompiledForest
+
+# Precisão da matriz de embeddings no disco: "float32" (padrão) ou "float16" (metade do tamanho)
+EMB_DTYPE = os.getenv("EMB_DTYPE", "float32")
+
+# Nome no HuggingFace ou caminho local de um modelo SentenceTransformer
+SBERT_MODEL_NAME = os.getenv("SBERT_MODEL_NAME", "all-MiniLM-L6-v2")
+# Cache de embeddings endereçado por conteúdo: sha1(texto) -> embedding normalizado (float32)
+EMB_CACHE_FILE = "sbert_emb_cache.npz"
+SBERT_MODEL_DIR = os.getenv("SBERT_MODEL_DIR", "sbert_model")
+# Fração do vocabulário que pode mudar (tokens novos + tokens que sumiram) antes de reconstruí-lo do zero
+VOCAB_DRIFT_MAX = float(os.getenv("VOCAB_DRIFT_MAX", "0.2"))
+# Índice dos embeddings: "exact", "ivf" ou vazio (IVF a partir de SBERT_IVF_MIN_ROWS exemplos)
+SBERT_INDEX = os.getenv("SBERT_INDEX", "")
+SBERT_IVF_MIN_ROWS = int(os.getenv("SBERT_IVF_MIN_ROWS", "20000"))
+# Artefatos que vão para o pacote do modelo (model_bundle.py)
+BUNDLE_ARTIFACTS = ["model.bin", "forest.npz", "model_tfidf.bin", "tfidf_matrix.npz", "allWords.json", "labels.json",
+                    "all_examples_texts.json", "all_examples_labels.json", "all_examples_weights.json",
+                    "bert_emb_matrix.npy", "sbert_index.npz"]
+
+_sbert_model = None
+
+def extend_vocab(old_vocab, examples, max_drift=VOCAB_DRIFT_MAX):
+    # Mantém a ordem do vocabulário anterior e acrescenta os tokens novos no fim;
+    # reconstrói (ordenado) quando a mudança passa de max_drift. Retorna (vocab, reconstruido).
+    tokens = set(build_vocab(examples))
+    if not old_vocab:
+        return sorted(tokens), True
+    old = set(old_vocab)
+    added = sorted(tokens - old)
+    drift = (len(added) + len(old - tokens)) / len(old_vocab)
+    if drift > max_drift:
+        return sorted(tokens), True
+    return list(old_vocab) + added, False
+
+def _get_sbert_model():
+    global _sbert_model
+    if _sbert_model is None:
+        _sbert_model = SentenceTransformer(SBERT_MODEL_NAME)
+    return _sbert_model
+
+def _text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def load_emb_cache():
+    if os.path.exists(EMB_CACHE_FILE):
+        data = np.load(EMB_CACHE_FILE)
+        if str(data["model"]) != SBERT_MODEL_NAME:
+            return {}
+        return dict(zip(data["keys"].tolist(), data["emb"]))
+    # Primeira vez: aproveita os artefatos do último treino, se baterem
+    if os.path.exists("bert_emb_matrix.npy") and os.path.exists("all_examples_texts.json"):
+        with open("all_examples_texts.json", "r", encoding="utf-8") as f:
+            texts = json.load(f)
+        emb = np.load("bert_emb_matrix.npy").astype(np.float32)
+        if len(texts) == emb.shape[0]:
+            return {_text_key(t): row for t, row in zip(texts, emb)}
+    return {}
+
+def save_emb_cache(cache, keys):
+    tmp = EMB_CACHE_FILE + ".tmp.npz"
+    np.savez(tmp, model=np.array(SBERT_MODEL_NAME), keys=np.array(keys), emb=np.stack([cache[k] for k in keys]))
+    os.replace(tmp, EMB_CACHE_FILE)
+
+def encode_with_cache(texts):
+    # Só codifica os textos novos ou alterados; o cache guarda apenas os textos do corpus atual
+    cache = load_emb_cache()
+    keys = [_text_key(t) for t in texts]
+    missing = {k: t for k, t in zip(keys, texts) if k not in cache}
+    if missing:
+        new_emb = _get_sbert_model().encode(list(missing.values()), show_progress_bar=False, normalize_embeddings=True)
+        cache.update(zip(missing.keys(), np.asarray(new_emb, dtype=np.float32)))
+    print(f"[Auto-UX] Embeddings: {len(missing)} textos codificados, {len(set(keys)) - len(missing)} reaproveitados do cache.")
+    save_emb_cache(cache, list(dict.fromkeys(keys)))
+    return np.stack([cache[k] for k in keys])
+
+# Todos os artefatos num único commit (o servidor nunca vê um modelo pela metade)
+def upload_artifacts_to_github(artifacts, commit_msg="Atualiza modelo"):
+    files = {}
+    for fname, filedata in artifacts.items():
+        if len(filedata) > 90*1024*1024:
             print(f"[Auto-UX] Pulando upload de {fname}: arquivo > 90MB.")
             continue
-        print(f"[Auto-UX] Enviando {fname} para o GitHub...")
-        _, sha = get_file_from_github(fname)
-        status, resp = save_file_to_github(fname, filedata, "Atualiza " + fname, sha=sha, is_binary=is_binary)
-        print(f"[Auto-UX] Upload {fname}: status {status}")
+        files[fname] = filedata
+    if not files:
+        return
+    print(f"[Auto-UX] Enviando {', '.join(files)} para o GitHub num único commit...")
+    status, resp = commit_files_to_github(files, commit_msg)
+    print(f"[Auto-UX] Upload: status {status}")
 
-def train_and_save_model(json_path="ux_examples.json"):
+# progress(stage, fração) é chamado no início de cada etapa (usado pela fila de treino).
+# json_path: arquivo JSON com a lista de exemplos ou diretório de um ExampleStore
+# (que já descarta duplicados na inserção).
+def train_and_save_model(json_path="ux_examples.json", progress=None):
+    if progress is None:
+        progress = lambda stage, fraction: None
+    progress("exemplos", 0.0)
     print("[Auto-UX] Lendo exemplos rotulados...")
-    with open(json_path, "r", encoding="utf-8") as f:
-        examples = json.load(f)
+    if os.path.isdir(json_path):
+        from example_store import ExampleStore
+        examples = list(ExampleStore(json_path).iter_examples())
+    else:
+        with open(json_path, "r", encoding="utf-8") as f:
+            examples = json.load(f)
     if not examples:
         raise Exception("Nenhum exemplo rotulado encontrado!")
     print(f"[Auto-UX] {len(examples)} exemplos carregados.")
 
-    # Remove duplicados
-    seen = set()
-    filtered = []
-    for ex in examples:
-        sig = json.dumps(ex, sort_keys=True)
-        if sig not in seen:
-            filtered.append(ex)
-            seen.add(sig)
-    examples = filtered
-    print(f"[Auto-UX] {len(examples)} exemplos após remover duplicados.")
+    if not os.path.isdir(json_path):
+        # Remove duplicados
+        seen = set()
+        filtered = []
+        for ex in examples:
+            sig = json.dumps(ex, sort_keys=True)
+            if sig not in seen:
+                filtered.append(ex)
+                seen.add(sig)
+        examples = filtered
+        print(f"[Auto-UX] {len(examples)} exemplos após remover duplicados.")
+
+    # Quase-duplicados viram um representante com peso (sample_weight no RF, voto no kNN)
+    reps, weights, dedup_report = collapse_near_duplicates(examples, [ex["sessao"] for ex in examples])
+    examples = [examples[i] for i in reps]
+    print(f"[Auto-UX] Quase-duplicados: {dedup_report['examples']} -> {dedup_report['representatives']} exemplos "
+          f"(-{dedup_report.get('shrink', 0.0):.1%}, Jaccard >= {dedup_report['threshold']}).")
 
     # RandomForest
-    vocab = build_vocab(examples)
-    print(f"[Auto-UX] Vocab extraído: {len(vocab)} tokens.")
-    X = [example_to_vector(ex, vocab) for ex in examples]
+    progress("randomforest", 0.05)
+    old_vocab = None
+    if os.path.exists("allWords.json"):
+        with open("allWords.json", "r", encoding="utf-8") as f:
+            old_vocab = json.load(f)
+    vocab, rebuilt = extend_vocab(old_vocab, examples)
+    print(f"[Auto-UX] Vocab {'reconstruído' if rebuilt else 'estendido'}: {len(vocab)} tokens.")
+    X = Featurizer(vocab).transform(examples)
     y_raw = [ex["sessao"] for ex in examples]
     label_encoder = LabelEncoder()
     y = label_encoder.fit_transform(y_raw)
     print("[Auto-UX] Treinando modelo RandomForest...")
     clf = RandomForestClassifier(n_estimators=120, random_state=42)
-    clf.fit(X, y)
+    clf.fit(X, y, sample_weight=np.asarray(weights, dtype=np.float64))
+    # Floresta achatada em arrays para a predição (compiled_forest.py), sem o sklearn no caminho quente
+    CompiledForest.from_sklearn(clf).save("forest.npz")
     print("[Auto-UX] Modelo RF treinado!")
 
-    # TF-IDF
+    # TF-IDF (norm='l2' por padrão: as linhas já saem normalizadas, cosseno = produto escalar).
+    # Salva em CSC: a transposta vira CSR termos x exemplos, e a consulta só percorre
+    # as listas de exemplos dos termos presentes no texto (índice invertido).
+    progress("tfidf", 0.3)
     texts = [flatten_features(ex) for ex in examples]
-    tfidf = TfidfVectorizer().fit(texts)
+    tfidf = TfidfVectorizer()
+    tfidf_matrix = tfidf.fit_transform(texts).tocsc()
     print("[Auto-UX] TF-IDF treinado!")
 
     # SBERT embeddings
+    progress("sbert", 0.4)
     print("[Auto-UX] Gerando embeddings BERT...")
-    sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
-    emb_matrix = sbert_model.encode(texts, show_progress_bar=False)
-    with open("bert_emb_matrix.json", "w", encoding="utf-8") as f:
-        json.dump(emb_matrix.tolist(), f)
-
-    # Salva SBERT como base64 tar.gz só local
-    with tempfile.TemporaryDirectory() as tmpdir:
-        sbert_model.save(tmpdir)
-        tar_bytes = io.BytesIO()
-        with tarfile.open(fileobj=tar_bytes, mode='w:gz') as tar:
-            tar.add(tmpdir, arcname="model")
-        tar_b64 = base64.b64encode(tar_bytes.getvalue()).decode()
-        with open("sbert_model_b64.json", "w", encoding="utf-8") as f:
-            json.dump({"base64": tar_b64}, f)
+    # Linhas já normalizadas: na predição o cosseno vira um produto matriz-vetor
+    emb_matrix = encode_with_cache(texts)
+    np.save("bert_emb_matrix.npy", np.ascontiguousarray(emb_matrix, dtype=EMB_DTYPE))
+    index_kind = SBERT_INDEX or ("ivf" if len(texts) >= SBERT_IVF_MIN_ROWS else "exact")
+    build_index(np.load("bert_emb_matrix.npy", mmap_mode="r"), index_kind).save("sbert_index.npz")
+    print(f"[Auto-UX] Índice SBERT ({index_kind}) salvo.")
+
+    # Salva o SBERT em diretório só local (o modelo não muda entre treinos e não vai no pacote);
+    # workers de outras máquinas criam o deles a partir de SBERT_MODEL_NAME (sbert_encoder.ensure_model_dir)
+    if not os.path.exists(os.path.join(SBERT_MODEL_DIR, "model.safetensors")):
+        from sbert_encoder import ensure_model_dir
+        ensure_model_dir(SBERT_MODEL_DIR, SBERT_MODEL_NAME, model=_get_sbert_model())
 
     # Persiste tudo
+    progress("salvando", 0.8)
     joblib.dump(clf, "model.bin")
     joblib.dump(tfidf, "model_tfidf.bin")
+    sparse.save_npz("tfidf_matrix.npz", tfidf_matrix)
     with open("allWords.json", "w", encoding="utf-8") as f:
         json.dump(vocab, f, ensure_ascii=False)
     with open("labels.json", "w", encoding="utf-8") as f:
         json.dump(list(label_encoder.classes_), f, ensure_ascii=False)
     with open("all_examples_texts.json", "w", encoding="utf-8") as f:
         json.dump(texts, f, ensure_ascii=False)
-    print("[Auto-UX] Tudo salvo (modelo, vocab, labels, tfidf, textos, embeddings, sbert-model)!")
-
-    # Upload para o GitHub (exceto SBERT b64)
-    artifacts = {
-        "model.bin": (open("model.bin", "rb").read(), True),
-        "model_tfidf.bin": (open("model_tfidf.bin", "rb").read(), True),
-        "allWords.json": (open("allWords.json", "r").read(), False),
-        "labels.json": (open("labels.json", "r").read(), False),
-        "all_examples_texts.json": (open("all_examples_texts.json", "r").read(), False),
-        "bert_emb_matrix.json": (open("bert_emb_matrix.json", "r").read(), False),
-        # "sbert_model_b64.json": (open("sbert_model_b64.json", "r").read(), False),  # nunca sobe!
-    }
-    upload_artifacts_to_github(artifacts)
+    with open("all_examples_labels.json", "w", encoding="utf-8") as f:
+        json.dump(y_raw, f, ensure_ascii=False)
+    with open("all_examples_weights.json", "w", encoding="utf-8") as f:
+        json.dump(weights, f)
+    print("[Auto-UX] Tudo salvo (modelo, vocab, labels, tfidf, matriz tfidf, textos, embeddings, sbert-model)!")
+
+    # Pacote versionado (zip + manifest com checksums), trocado atomicamente: os workers
+    # percebem a versão nova e recarregam sem reiniciar
+    manifest = write_bundle(BUNDLE_ARTIFACTS, BUNDLE_FILE, meta={"examples": len(examples), "dedup": dedup_report})
+    print(f"[Auto-UX] Pacote {BUNDLE_FILE} versão {manifest['version']} salvo.")
+
+    # Upload para o GitHub: o pacote + labels.json (lido pelo /get_labels), num commit só
+    progress("upload", 0.85)
+    artifacts = {}
+    for fname in (BUNDLE_FILE, "labels.json"):
+        with open(fname, "rb") as f:
+            artifacts[fname] = f.read()
+    upload_artifacts_to_github(artifacts, f"Atualiza modelo {manifest['version']}")
+    return {"dedup": dedup_report, "version": manifest["version"]}
 
 if __name__ == "__main__":
     train_and_save_model()
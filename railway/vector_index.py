@@ -0,0 +1,111 @@
+import numpy as np
+
+# Índices de vizinhos mais próximos para os embeddings SBERT (linhas L2-normalizadas,
+# similaridade = produto escalar). Os vetores continuam em bert_emb_matrix.npy (mmap);
+# o índice guarda só a estrutura e é salvo em .npz junto com os outros artefatos.
+#   ExactIndex: busca exata por blocos de linhas (memória limitada, aceita float16)
+#   IVFIndex:   k-means esférico + listas invertidas; visita só as nprobe listas mais próximas
+
+BLOCK_ROWS = 8192
+
+def _topk(scores, k):
+    # top-k por linha, em ordem decrescente
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, matrix, block_rows=BLOCK_ROWS):
+        self.matrix = matrix
+        self.block_rows = block_rows
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32)
+        n = self.matrix.shape[0]
+        best_ids = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+        for start in range(0, n, self.block_rows):
+            block = np.asarray(self.matrix[start:start + self.block_rows], dtype=np.float32)
+            ids, scores = _topk(queries @ block.T, k)
+            # Junta o top-k do bloco com o acumulado e fica com os k melhores
+            best_ids = np.concatenate([best_ids, ids + start], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_ids.shape[1] > k:
+                sel, best_scores = _topk(best_scores, k)
+                best_ids = np.take_along_axis(best_ids, sel, axis=1)
+        return best_ids, best_scores
+
+    def save(self, path):
+        np.savez(path, kind=np.array(self.kind))
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, matrix, centroids, order, offsets, nprobe=16):
+        self.matrix = matrix
+        self.centroids = centroids  # (nlist, dim) normalizados
+        self.order = order          # ids das linhas agrupados por lista
+        self.offsets = offsets      # lista c = order[offsets[c]:offsets[c + 1]]
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, matrix, nlist=None, n_iter=10, sample=None, nprobe=16, seed=42):
+        n = matrix.shape[0]
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample_ids = np.sort(rng.choice(n, size=min(n, sample or 64 * nlist), replace=False))
+        data = np.asarray(matrix[sample_ids], dtype=np.float32)
+        centroids = data[rng.choice(data.shape[0], size=min(nlist, data.shape[0]), replace=False)].copy()
+        for _ in range(n_iter):
+            assign = cls._assign(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = np.bincount(assign, minlength=len(centroids)) == 0
+            # Lista vazia: reinicia o centróide num ponto aleatório da amostra
+            sums[empty] = data[rng.choice(data.shape[0], size=int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        assign = np.concatenate([cls._assign(np.asarray(matrix[s:s + BLOCK_ROWS], dtype=np.float32), centroids)
+                                 for s in range(0, n, BLOCK_ROWS)])
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))]).astype(np.int64)
+        return cls(matrix, centroids.astype(np.float32), order, offsets, nprobe=nprobe)
+
+    @staticmethod
+    def _assign(data, centroids):
+        return np.argmax(data @ centroids.T, axis=1)
+
+    def search(self, queries, k=1, nprobe=None):
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probe_ids, _ = _topk(queries @ self.centroids.T, nprobe)
+        all_ids = np.zeros((queries.shape[0], k), dtype=np.int64)
+        all_scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+        for qi, lists in enumerate(probe_ids):
+            cand = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            if cand.size == 0:
+                continue
+            cand.sort()  # acesso sequencial ao mmap
+            scores = np.asarray(self.matrix[cand], dtype=np.float32) @ queries[qi]
+            sel, top = _topk(scores[None, :], k)
+            all_ids[qi, :sel.shape[1]] = cand[sel[0]]
+            all_scores[qi, :sel.shape[1]] = top[0]
+        return all_ids, all_scores
+
+    def save(self, path):
+        np.savez(path, kind=np.array(self.kind), centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, nprobe=np.array(self.nprobe))
+
+def build_index(matrix, kind="exact", **kwargs):
+    if kind == "ivf":
+        return IVFIndex.build(matrix, **kwargs)
+    return ExactIndex(matrix)
+
+def load_index(path, matrix):
+    data = np.load(path)
+    if str(data["kind"]) == "ivf":
+        return IVFIndex(matrix, data["centroids"], data["order"], data["offsets"], nprobe=int(data["nprobe"]))
+    return ExactIndex(matrix)